@@ -0,0 +1,224 @@
+"""Throughput and p50/p99 latency of the pricing API endpoints.
+
+    cd backend && pip install -r requirements-dev.txt
+    python -m benchmarks.api [--food-types 2] [--plan-types 3]
+                             [--requests 2000] [--concurrency 16]
+                             [--database-url URL] [--output results.json]
+
+The app is driven in process through httpx's ASGI transport, against a SQLite
+file in a temp directory (through aiosqlite) unless --database-url points at
+a throwaway Postgres database; httpx and aiosqlite are in requirements-dev.txt.
+Either way the catalogue is replaced with a synthetic one, so never point this
+at real data. Results are printed (and optionally written) as JSON tagged with
+the current commit, so runs can be diffed across commits.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from decimal import Decimal
+
+MEAL_TYPES = [
+    "3 Meals {Breakfast+Tea & Lunch + Dinner}",
+    "2 Meals {Breakfast+Tea & Lunch}",
+    "1 Meal Lunch",
+    "1 Meal Dinner"
+]
+FOOD_TYPES = ["Veg", "Non - Veg"]
+PLAN_TYPES = ["Basic", "Standard", "Premium"]
+SERVICE_CODES = ["A", "B", "C", "D"]
+ENDPOINTS = ["calculate_total", "save_details", "meals", "additional_services", "calculate_price"]
+
+
+def _names(real, count, prefix):
+    # The real names first (save_details only accepts those), then synthetic ones
+    return real[:count] + [f"{prefix} {i}" for i in range(len(real) + 1, count + 1)]
+
+
+def synthetic_catalogue(food_types: int, plan_types: int):
+    meals, services = [], []
+    for food_index, food_type in enumerate(_names(FOOD_TYPES, food_types, "Food")):
+        for plan_index, plan_type in enumerate(_names(PLAN_TYPES, plan_types, "Plan")):
+            for meal_index, meal_type in enumerate(MEAL_TYPES):
+                for num_people in range(1, 8):
+                    meals.append({
+                        "food_type": food_type,
+                        "plan_type": plan_type,
+                        "num_people": num_people,
+                        "basic_details": meal_type,
+                        "basic_price": Decimal(4000 + 1500 * num_people + 500 * plan_index + 300 * meal_index + 100 * food_index)
+                    })
+            for code in SERVICE_CODES:
+                percentage = code == "C"
+                services.append({
+                    "code": code,
+                    "name": f"Service {code}",
+                    "is_percentage": percentage,
+                    "food_type": food_type,
+                    "plan_type": plan_type,
+                    "meal_combo": MEAL_TYPES[1],
+                    **{f"price_{n}": Decimal(10) if percentage else Decimal(200 * n) for n in range(1, 8)}
+                })
+    return meals, services
+
+
+def request_factories(meals, meal_ids, service_ids):
+    # One function per endpoint returning (method, path, kwargs) for a random request
+    def calculate_total(rng):
+        meal = rng.choice(meals)
+        return "GET", "/calculate_total", {"params": {
+            "food_type": meal["food_type"],
+            "plan_type": meal["plan_type"],
+            "num_people": meal["num_people"],
+            "meal_type": meal["basic_details"],
+            "services": rng.sample(SERVICE_CODES, rng.randint(0, len(SERVICE_CODES)))
+        }}
+
+    def save_details(rng):
+        return "POST", "/save_details", {"json": {
+            "food_type": rng.choice(FOOD_TYPES),
+            "plan_type": rng.choice(PLAN_TYPES),
+            "num_people": rng.randint(1, 7),
+            "basic_details": rng.choice(MEAL_TYPES)
+        }}
+
+    def list_meals(rng):
+        return "GET", "/meals/", {}
+
+    def list_additional_services(rng):
+        return "GET", "/additional-services/", {"params": {"num_people": rng.randint(1, 7)}}
+
+    def calculate_price(rng):
+        return "POST", "/calculate-price/", {"json": {
+            "meal_id": rng.choice(meal_ids),
+            "service_ids": rng.sample(service_ids, min(2, len(service_ids)))
+        }}
+
+    return {
+        "calculate_total": calculate_total,
+        "save_details": save_details,
+        "meals": list_meals,
+        "additional_services": list_additional_services,
+        "calculate_price": calculate_price
+    }
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+async def run_endpoint(client, factory, requests, concurrency, seed):
+    rng = random.Random(seed)
+    planned = [factory(rng) for _ in range(requests)]
+    latencies, errors = [], 0
+    queue = iter(planned)
+
+    async def worker():
+        nonlocal errors
+        for method, path, kwargs in queue:
+            start = time.perf_counter()
+            response = await client.request(method, path, **kwargs)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code >= 400:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "requests": requests,
+        "errors": errors,
+        "throughput_rps": round(requests / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "max_ms": round(latencies[-1] * 1000, 3)
+    }
+
+
+def _commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def benchmark(args):
+    import httpx
+    from sqlalchemy import select
+    import models
+    from database import Base, engine, async_engine
+    from loader import replace_catalogue
+    from main import app
+    from writebehind import user_details_queue
+
+    meals, services = synthetic_catalogue(args.food_types, args.plan_types)
+    Base.metadata.create_all(engine)
+    replace_catalogue(meals, services)
+    with engine.connect() as conn:
+        meal_ids = conn.execute(select(models.Meals.id)).scalars().all()
+        service_ids = conn.execute(select(models.AdditionalService.id)).scalars().all()
+
+    factories = request_factories(meals, meal_ids, service_ids)
+    results = {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+        for name in args.endpoints:
+            # Warm-up also loads the price table, so it isn't counted against the first endpoint
+            await run_endpoint(client, factories[name], args.warmup, args.concurrency, args.seed)
+            results[name] = await run_endpoint(client, factories[name], args.requests, args.concurrency, args.seed)
+
+    user_details_queue.stop()
+    await async_engine.dispose()
+    engine.dispose()
+    return {
+        "commit": _commit(),
+        "python": platform.python_version(),
+        "database": engine.url.get_backend_name(),
+        "catalogue": {"meals": len(meals), "additional_services": len(services)},
+        "concurrency": args.concurrency,
+        "results": results
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--food-types", type=int, default=2, help="Food types in the synthetic catalogue")
+    parser.add_argument("--plan-types", type=int, default=3, help="Plan types per food type")
+    parser.add_argument("--requests", type=int, default=2000, help="Measured requests per endpoint")
+    parser.add_argument("--warmup", type=int, default=100, help="Unmeasured requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=16, help="Requests in flight at once")
+    parser.add_argument("--seed", type=int, default=1, help="Seed for the request mix")
+    parser.add_argument("--endpoints", nargs="+", choices=ENDPOINTS, default=ENDPOINTS)
+    parser.add_argument("--database-url", help="Throwaway database to use instead of a temporary SQLite file")
+    parser.add_argument("--output", help="Also write the results to this file")
+    args = parser.parse_args(argv)
+
+    # Settings are read when the app modules are imported, so they go in the environment first
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["DATABASE_URL"] = args.database_url or f"sqlite:///{os.path.join(tmp, 'benchmark.db')}"
+        os.environ["USER_DETAILS_SPILL_DIR"] = os.path.join(tmp, "spill")
+        os.environ.setdefault("LOG_LEVEL", "WARNING")
+        report = asyncio.run(benchmark(args))
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,92 @@
+"""CPU cost of encoding listing responses: response_model validation + default
+JSON encoding versus the precompiled serializers in serialization.py.
+
+    cd backend && python -m benchmarks.serialization [--meals 1000] [--repeat 50]
+
+No database is needed; the rows are transient ORM objects.
+"""
+import argparse
+import json
+import time
+from decimal import Decimal
+from typing import List
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+import models
+import schemas
+from serialization import dumps, serialize_meals
+
+
+def make_catalogue(num_meals: int) -> List[models.Meals]:
+    services = [
+        models.AdditionalService(
+            id=code_index + 1,
+            code=code,
+            name=f"Service {code}",
+            is_percentage=code == "C",
+            food_type="Veg",
+            plan_type="Basic",
+            meal_combo="2 Meals",
+            **{f"price_{n}": Decimal("10.00") if code == "C" else Decimal(100 * n) for n in range(1, 8)}
+        )
+        for code_index, code in enumerate("ABCD")
+    ]
+    meals = []
+    for i in range(num_meals):
+        meal = models.Meals(
+            id=i + 1,
+            food_type="Veg" if i % 2 else "Non - Veg",
+            plan_type=("Basic", "Standard", "Premium")[i % 3],
+            num_people=i % 7 + 1,
+            basic_details="2 Meals {Breakfast+Tea & Lunch}",
+            basic_price=Decimal("1000.00") + i
+        )
+        meal.additional_services = services[:i % 5]
+        meals.append(meal)
+    return meals
+
+
+def response_model_path(adapter, meals) -> bytes:
+    # What FastAPI does for response_model=List[schemas.Meal] with a JSONResponse
+    validated = adapter.validate_python(meals, from_attributes=True)
+    content = jsonable_encoder(adapter.dump_python(validated, mode="json"))
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode()
+
+
+def fast_path(meals) -> bytes:
+    return dumps(serialize_meals(meals))
+
+
+def measure(fn, repeat: int) -> float:
+    fn()
+    start = time.process_time()
+    for _ in range(repeat):
+        fn()
+    return (time.process_time() - start) / repeat
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--meals", type=int, default=1000, help="Meals per response")
+    parser.add_argument("--repeat", type=int, default=50, help="Responses encoded per measurement")
+    args = parser.parse_args(argv)
+
+    meals = make_catalogue(args.meals)
+    adapter = TypeAdapter(List[schemas.Meal])
+
+    # Both paths must produce the same document
+    assert json.loads(response_model_path(adapter, meals)) == json.loads(fast_path(meals))
+
+    baseline = measure(lambda: response_model_path(adapter, meals), args.repeat)
+    fast = measure(lambda: fast_path(meals), args.repeat)
+    print(json.dumps({
+        "meals_per_response": args.meals,
+        "response_model_ms": round(baseline * 1000, 3),
+        "fast_path_ms": round(fast * 1000, 3),
+        "cpu_saving_ms": round((baseline - fast) * 1000, 3),
+        "speedup": round(baseline / fast, 2)
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
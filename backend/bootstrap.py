@@ -0,0 +1,24 @@
+import logging
+import time
+from sqlalchemy.engine import make_url
+from database import create_database, SQLALCHEMY_DATABASE_URL
+from migrations import migrate_database
+from logging_config import configure_logging
+
+logger = logging.getLogger(__name__)
+
+def bootstrap():
+    # One-off setup: create the database if needed and bring the schema up to
+    # date. Run it once per deploy (python bootstrap.py) rather than in every
+    # worker; set DB_BOOTSTRAP_ON_STARTUP=1 to run it from the app lifespan instead
+    start = time.perf_counter()
+    create_database()
+    migrate_database()
+
+    elapsed = time.perf_counter() - start
+    logger.info(f"Bootstrapped {make_url(SQLALCHEMY_DATABASE_URL).database} in {elapsed:.2f}s")
+    return elapsed
+
+if __name__ == "__main__":
+    configure_logging()
+    bootstrap()
@@ -0,0 +1,322 @@
+import asyncio
+import hashlib
+import json
+import logging
+import mmap
+import os
+import queue
+import struct
+import threading
+import time
+from collections import OrderedDict
+from decimal import Decimal
+from threading import Lock
+from typing import Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Pricing cache tiers. Every worker keeps its own LRU (LocalCache); an optional
+# shared tier lets workers see each other's entries and, more importantly,
+# agree on a catalogue version. Callers put the version in their keys, and a
+# write anywhere bumps it, so every worker drops stale entries and reloads.
+#
+#   PRICING_CACHE_BACKEND=file    PRICING_CACHE_FILE=/tmp/pricing-catalogue.version, shares the
+#                                 version only; quotes stay per process (default)
+#   PRICING_CACHE_BACKEND=redis   PRICING_CACHE_URL=redis://localhost:6379/0, needs the redis package;
+#                                 use it when workers run on more than one host
+#   PRICING_CACHE_BACKEND=local   per-process only; a catalogue change reaches
+#                                 other workers only when they restart
+
+# The shared tier holds JSON rather than pickle, so anyone who can write to the
+# cache server can't run code in the workers. Decimals are stored as strings.
+def _encode(value):
+    if value is None or isinstance(value, (str, bool, int, float)):
+        return value
+    if isinstance(value, Decimal):
+        return {"$decimal": str(value)}
+    if isinstance(value, tuple):
+        return {"$tuple": [_encode(item) for item in value]}
+    if isinstance(value, list):
+        return [_encode(item) for item in value]
+    if isinstance(value, dict) and all(isinstance(key, str) for key in value):
+        return {"$dict": {key: _encode(item) for key, item in value.items()}}
+    raise TypeError(f"Can't store {type(value).__name__} in the shared cache")
+
+
+def _decode(value):
+    if isinstance(value, list):
+        return [_decode(item) for item in value]
+    if not isinstance(value, dict):
+        return value
+    if "$decimal" in value:
+        return Decimal(value["$decimal"])
+    if "$tuple" in value:
+        return tuple(_decode(item) for item in value["$tuple"])
+    return {key: _decode(item) for key, item in value["$dict"].items()}
+
+
+def dumps(value) -> bytes:
+    return json.dumps(_encode(value), separators=(",", ":")).encode()
+
+
+def loads(raw: bytes):
+    return _decode(json.loads(raw))
+
+
+class LocalCache:
+    """In-process LRU cache with a TTL."""
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[tuple, Tuple[float, object]]" = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: tuple):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: tuple, value):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class RedisTier:
+    """Shared entries and catalogue version in a Redis-compatible server."""
+
+    name = "redis"
+    shares_entries = True
+
+    def __init__(self, url: str, prefix: str = "pricing"):
+        import redis
+
+        # Short timeouts: a slow cache must not be slower than recomputing
+        self._client = redis.Redis.from_url(url, socket_timeout=0.05, socket_connect_timeout=0.05)
+        self._prefix = prefix
+        self._version_key = f"{prefix}:catalogue_version"
+
+    def _key(self, key: tuple) -> str:
+        return f"{self._prefix}:entry:{hashlib.sha1(repr(key).encode()).hexdigest()}"
+
+    def get(self, key: tuple):
+        raw = self._client.get(self._key(key))
+        return loads(raw) if raw is not None else None
+
+    def set(self, key: tuple, value, ttl_seconds: float):
+        self._client.set(self._key(key), dumps(value), px=max(1, int(ttl_seconds * 1000)))
+
+    def get_version(self) -> int:
+        return int(self._client.get(self._version_key) or 0)
+
+    def bump_version(self) -> int:
+        return int(self._client.incr(self._version_key))
+
+
+class VersionFile:
+    """Catalogue version as an 8-byte counter in a memory-mapped file.
+
+    Lets workers on one host agree on the version without a server. Entries
+    are not shared; get() always misses.
+    """
+
+    name = "file"
+    shares_entries = False
+
+    def __init__(self, path: str):
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if os.fstat(fd).st_size < 8:
+                os.ftruncate(fd, 8)
+            self._map = mmap.mmap(fd, 8)
+        finally:
+            os.close(fd)
+        self._path = path
+
+    def get(self, key: tuple):
+        return None
+
+    def set(self, key: tuple, value, ttl_seconds: float):
+        pass
+
+    def get_version(self) -> int:
+        return struct.unpack("<Q", self._map[:8])[0]
+
+    def bump_version(self) -> int:
+        import fcntl
+
+        # The file lock serializes increments from different processes
+        with open(self._path, "rb") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                version = self.get_version() + 1
+                self._map[:8] = struct.pack("<Q", version)
+                self._map.flush()
+                return version
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+class TieredCache:
+    """Local LRU in front of an optional shared tier, plus the catalogue version.
+
+    Callers run on the event loop, so only get_async() and publish() talk to
+    the shared tier directly; the version is polled and entries are written by
+    a background thread. Shared tier errors are logged and treated as misses,
+    so the cache can only make a request faster, never fail it.
+    """
+
+    def __init__(self, local: LocalCache, shared=None, version_check_seconds: float = 1.0,
+                 max_pending_writes: int = 1000):
+        self.local = local
+        self.shared = shared
+        self.version_check_seconds = version_check_seconds
+        self._version = 0
+        self._version_checked = 0.0
+        self._writes: queue.Queue = queue.Queue(max_pending_writes)
+        self._worker: Optional[threading.Thread] = None
+        self._worker_lock = Lock()
+        self.shared_hits = 0
+        self.shared_errors = 0
+        self.dropped_writes = 0
+
+    def _shared_call(self, method, *args, default=None):
+        try:
+            return getattr(self.shared, method)(*args)
+        except Exception as e:
+            self.shared_errors += 1
+            logger.warning("Pricing cache %s.%s failed: %s", self.shared.name, method, e)
+            return default
+
+    def _set_version(self, version: int):
+        if version != self._version:
+            self._version = version
+            self.local.clear()
+
+    def _start_worker(self):
+        if self._worker is None:
+            with self._worker_lock:
+                if self._worker is None:
+                    # Once, so the first load already uses the shared version
+                    self._version_checked = time.monotonic()
+                    self._set_version(self._shared_call("get_version", default=self._version))
+                    self._worker = threading.Thread(target=self._run, name="pricing-cache", daemon=True)
+                    self._worker.start()
+
+    def _run(self):
+        # Re-reads the shared version every version_check_seconds and writes
+        # queued entries in between
+        while True:
+            try:
+                key, value = self._writes.get(timeout=self.version_check_seconds)
+                self._shared_call("set", key, value, self.local.ttl_seconds)
+            except queue.Empty:
+                pass
+            now = time.monotonic()
+            if now - self._version_checked >= self.version_check_seconds:
+                self._version_checked = now
+                self._set_version(self._shared_call("get_version", default=self._version))
+
+    def version(self) -> int:
+        if self.shared is not None:
+            self._start_worker()
+        return self._version
+
+    def publish(self) -> int:
+        # Announce a catalogue change to every worker sharing the tier
+        if self.shared is not None:
+            version = self._shared_call("bump_version")
+            if version is not None:
+                self._version_checked = time.monotonic()
+                self._set_version(version)
+                return version
+        self._set_version(self._version + 1)
+        return self._version
+
+    def _shares_entries(self) -> bool:
+        return self.shared is not None and self.shared.shares_entries and self.local.max_entries > 0
+
+    def get(self, key: tuple):
+        # This worker's entries only
+        return self.local.get(key)
+
+    async def get_async(self, key: tuple):
+        # Falls back to the shared tier on a local miss, in a worker thread.
+        # Only worth it for values that cost more than a round trip to rebuild
+        value = self.local.get(key)
+        if value is None and self._shares_entries():
+            value = await asyncio.to_thread(self._shared_call, "get", key)
+            if value is not None:
+                self.shared_hits += 1
+                self.local.put(key, value)
+        return value
+
+    def put(self, key: tuple, value, shared: bool = True):
+        self.local.put(key, value)
+        if shared and self._shares_entries():
+            self._start_worker()
+            try:
+                self._writes.put_nowait((key, value))
+            except queue.Full:
+                # The shared tier is slow or down; this worker still has the entry
+                self.dropped_writes += 1
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.shared.name if self.shared is not None else "local",
+            "version": self._version,
+            "entries": len(self.local),
+            "hits": self.local.hits + self.shared_hits,
+            "misses": self.local.misses - self.shared_hits,
+            "evictions": self.local.evictions,
+            "shared_hits": self.shared_hits,
+            "shared_errors": self.shared_errors,
+            "dropped_writes": self.dropped_writes
+        }
+
+
+def make_cache() -> TieredCache:
+    local = LocalCache(
+        max_entries=int(os.getenv("QUOTE_CACHE_SIZE", "10000")),
+        ttl_seconds=float(os.getenv("QUOTE_CACHE_TTL", "300"))
+    )
+    configured = os.getenv("PRICING_CACHE_BACKEND")
+    backend = (configured or "file").lower()
+    shared: Optional[object] = None
+    if backend == "redis":
+        shared = RedisTier(os.getenv("PRICING_CACHE_URL", "redis://localhost:6379/0"))
+    elif backend == "file":
+        path = os.getenv("PRICING_CACHE_FILE", "/tmp/pricing-catalogue.version")
+        try:
+            shared = VersionFile(path)
+        except OSError as e:
+            if configured:
+                raise
+            # Only the default; an unwritable /tmp shouldn't stop the app starting
+            logger.warning("Pricing cache version file %s unavailable, workers won't share catalogue changes: %s", path, e)
+    elif backend != "local":
+        raise ValueError(f"Unknown PRICING_CACHE_BACKEND: {backend}")
+    return TieredCache(local, shared, float(os.getenv("PRICING_VERSION_CHECK_SECONDS", "1")))
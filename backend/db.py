@@ -1,26 +1,35 @@
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
 from sqlalchemy.orm import sessionmaker, declarative_base
+from database import make_engine
 import dotenv
 import os
 
 dotenv.load_dotenv()
-POSTGRES = os.getenv("POSTGRES")  
-
-if not POSTGRES:
-    raise ValueError("POSTGRES environment variable is not set")
-
-SQLALCHEMY_DATABASE_URL = POSTGRES
-
-engine = create_engine(SQLALCHEMY_DATABASE_URL, echo=True)
 
 # Corrected naming convention
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+SessionLocal = sessionmaker(autocommit=False, autoflush=False)
 
 # Declarative base class
 Base = declarative_base()
 
+_engine = None
+
+def get_engine():
+    # Built on first use so importing this module needs no configuration
+    global _engine
+    if _engine is None:
+        url = os.getenv("POSTGRES")
+        if not url:
+            raise ValueError("POSTGRES environment variable is not set")
+
+        # SQL echo logs every statement, so it is opt-in
+        _engine = make_engine(url, echo=os.getenv("SQL_ECHO", "").lower() in ("1", "true", "yes"))
+        SessionLocal.configure(bind=_engine)
+    return _engine
+
 # Dependency
 def get_db():
+    get_engine()
     db = SessionLocal()
     try:
         yield db
@@ -29,14 +38,14 @@ def get_db():
 
 # Table creation helper
 def create_table():
-    Base.metadata.create_all(bind=engine)
+    Base.metadata.create_all(bind=get_engine())
 
 def drop_and_create_tables():
-    Base.metadata.drop_all(bind=engine)
-    Base.metadata.create_all(bind=engine)
+    Base.metadata.drop_all(bind=get_engine())
+    Base.metadata.create_all(bind=get_engine())
 
 def alter_table_auto_increment():
-    with engine.connect() as conn:
+    with get_engine().connect() as conn:
         # Create a sequence for the ID column
         conn.execute(text("""
             CREATE SEQUENCE IF NOT EXISTS veg_breakfast_lunch_id_seq;
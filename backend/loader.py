@@ -0,0 +1,304 @@
+import argparse
+import re
+import time
+from decimal import Decimal
+from typing import Dict, Iterator, List, NamedTuple, Tuple
+from openpyxl import load_workbook
+from pydantic import ValidationError
+from sqlalchemy import delete, select
+from sqlalchemy.dialects import postgresql, sqlite
+import models
+import schemas
+from database import engine
+from pricing import price_table, quote_cache
+
+# Price sheets are laid out as side-by-side blocks: a label column followed by one
+# column per household size. Each block starts with Food Type / Plan Type /
+# Number of people / Basic Details header rows, then Basic Price and the
+# "Additional Service" rows whose label ends in the service code (e.g. "... A").
+SERVICE_LABEL = re.compile(r"^(?P<name>.*\S)\s+(?P<code>[A-Z])$")
+SKIPPED_LABELS = ("final price", "comm")
+
+MEAL_KEY_COLUMNS = ("food_type_key", "plan_type_key", "num_people", "basic_details_key")
+MEAL_VALUE_COLUMNS = ("food_type", "plan_type", "basic_details", "basic_price")
+SERVICE_KEY_COLUMNS = ("code", "food_type_key", "plan_type_key", "meal_combo")
+SERVICE_VALUE_COLUMNS = ("name", "is_percentage", "food_type", "plan_type") + tuple(f"price_{n}" for n in range(1, 8))
+
+
+def _label(value) -> str:
+    return " ".join(str(value).split()) if isinstance(value, str) else ""
+
+
+def _size(value):
+    # Household size header: 1..6, and "7+" for the last column
+    try:
+        return int(str(value).strip().rstrip("+"))
+    except ValueError:
+        return None
+
+
+def iter_sheet_rows(path) -> Iterator[Tuple[str, str, dict]]:
+    """Stream (kind, location, row) tuples out of a pricing workbook.
+
+    kind is "meal" or "service". The workbook is opened read-only and read
+    row by row, so only the current band's header rows are held in memory.
+    """
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        for sheet in workbook.worksheets:
+            food_row = plan_row = None
+            blocks: Dict[int, dict] = {}
+            for row_number, row in enumerate(sheet.iter_rows(values_only=True), start=1):
+                labels = [_label(value).lower() for value in row]
+
+                # Food/Plan Type rows come before the row that tells us where the blocks are
+                if "food type" in labels:
+                    food_row, blocks = row, {}
+                    continue
+                if "plan type" in labels:
+                    plan_row = row
+                    continue
+                if "number of people" in labels:
+                    blocks = {}
+                    for offset, label in enumerate(labels):
+                        if label != "number of people":
+                            continue
+                        sizes = []
+                        for value in row[offset + 1:]:
+                            size = _size(value)
+                            if size is None:
+                                break
+                            sizes.append(size)
+                        blocks[offset] = {
+                            "food_type": _label(food_row[offset + 1]) if food_row else "",
+                            "plan_type": _label(plan_row[offset + 1]) if plan_row else "",
+                            "sizes": sizes,
+                            "details": [None] * len(sizes)
+                        }
+                    continue
+
+                for offset, block in blocks.items():
+                    label = labels[offset] if offset < len(labels) else ""
+                    values = row[offset + 1:offset + 1 + len(block["sizes"])]
+                    location = f"{sheet.title}!R{row_number}C{offset + 1}"
+
+                    if label == "basic details":
+                        block["details"] = [_label(value) for value in values]
+                    elif label == "basic price":
+                        for size, details, price in zip(block["sizes"], block["details"], values):
+                            if price is None:
+                                continue
+                            yield "meal", location, {
+                                "food_type": block["food_type"],
+                                "plan_type": block["plan_type"],
+                                "num_people": size,
+                                "basic_price": price,
+                                "basic_details": details
+                            }
+                    elif label and not label.startswith(SKIPPED_LABELS):
+                        match = SERVICE_LABEL.match(_label(row[offset]))
+                        if not match or all(value is None for value in values):
+                            continue
+                        prices = [Decimal(str(value)) if isinstance(value, (int, float)) else None for value in values]
+                        # Percentage add-ons are stored as fractions in the sheet (0.1 = 10%)
+                        # but as percentages in the database
+                        is_percentage = all(price is not None and price < 1 for price in prices)
+                        if is_percentage:
+                            prices = [price * 100 for price in prices]
+                        service = {
+                            "code": match.group("code"),
+                            "name": match.group("name"),
+                            "is_percentage": is_percentage,
+                            "food_type": block["food_type"],
+                            "plan_type": block["plan_type"],
+                            "meal_combo": block["details"][0] if block["details"] else ""
+                        }
+                        for size, price in zip(block["sizes"], prices):
+                            if 1 <= size <= 7:
+                                service[f"price_{size}"] = price
+                        yield "service", location, service
+    finally:
+        workbook.close()
+
+
+def read_workbooks(paths) -> Tuple[List[dict], List[dict], List[str]]:
+    # Validate every row against the API schemas; later rows with the same
+    # natural key replace earlier ones so overlapping sheets don't duplicate
+    meals: Dict[tuple, dict] = {}
+    services: Dict[tuple, dict] = {}
+    errors = []
+    for path in paths:
+        for kind, location, row in iter_sheet_rows(path):
+            try:
+                if kind == "meal":
+                    meal = schemas.MealBase(**row).model_dump()
+                    meals[meal_key(meal)] = meal
+                else:
+                    service = schemas.AdditionalServiceBase(**row).model_dump()
+                    services[service_key(service)] = service
+            except ValidationError as e:
+                errors.append(f"{path} {location}: {e.errors()[0]['msg']}")
+    return list(meals.values()), list(services.values()), errors
+
+
+def meal_key(row) -> tuple:
+    return (
+        models.normalize_key(row["food_type"]),
+        models.normalize_key(row["plan_type"]),
+        row["num_people"],
+        models.normalize_key(row["basic_details"])
+    )
+
+
+def service_key(row) -> tuple:
+    return (
+        row["code"],
+        models.normalize_key(row["food_type"]),
+        models.normalize_key(row["plan_type"]),
+        row["meal_combo"]
+    )
+
+
+# Sheet block (food type, plan type, meal type) a natural key belongs to; --prune
+# only deletes rows from blocks the incoming workbooks contain
+def meal_block(key: tuple) -> tuple:
+    return key[0], key[1], key[3]
+
+
+def service_block(key: tuple) -> tuple:
+    return key[1:]
+
+
+class Changeset(NamedTuple):
+    inserts: List[dict]
+    updates: List[dict]
+    deletes: List[int]
+
+    def summary(self) -> str:
+        return f"{len(self.inserts)} inserted, {len(self.updates)} updated, {len(self.deletes)} deleted"
+
+
+def diff_table(conn, table, incoming: List[dict], key_fn, block_fn, key_columns, value_columns,
+               prune=False) -> Changeset:
+    # Compare the incoming sheet with the current rows by natural key and keep only
+    # the rows that actually change
+    current = {}
+    columns = [table.c.id] + [table.c[name] for name in key_columns + value_columns]
+    for row in conn.execute(select(*columns)).mappings():
+        current[tuple(row[name] for name in key_columns)] = row
+
+    inserts, updates = [], []
+    seen = set()
+    for row in incoming:
+        key = key_fn(row)
+        seen.add(key)
+        existing = current.get(key)
+        if existing is None:
+            inserts.append(row)
+        elif any(existing[name] != row[name] for name in value_columns):
+            updates.append(row)
+
+    # Rows of blocks the sheets don't mention (other workbooks, meals added
+    # through the API) are never deleted
+    blocks = {block_fn(key) for key in seen} if prune else set()
+    deletes = [row["id"] for key, row in current.items() if key not in seen and block_fn(key) in blocks]
+    return Changeset(inserts, updates, deletes)
+
+
+def apply_changeset(conn, table, changes: Changeset, key_columns, value_columns):
+    upserts = changes.inserts + changes.updates
+    if upserts:
+        dialect = postgresql if conn.dialect.name == "postgresql" else sqlite
+        statement = dialect.insert(table)
+        statement = statement.on_conflict_do_update(
+            index_elements=list(key_columns),
+            set_={name: statement.excluded[name] for name in value_columns}
+        )
+        conn.execute(statement, upserts)
+    if changes.deletes:
+        conn.execute(delete(table).where(table.c.id.in_(changes.deletes)))
+
+
+def upsert_catalogue(meals: List[dict], services: List[dict], prune=False, dry_run=False) -> Dict[str, Changeset]:
+    # Apply only the rows that differ, in one short transaction
+    meals_table = models.Meals.__table__
+    services_table = models.AdditionalService.__table__
+    with engine.begin() as conn:
+        changes = {
+            "meals": diff_table(conn, meals_table, meals, meal_key, meal_block, MEAL_KEY_COLUMNS, MEAL_VALUE_COLUMNS, prune),
+            "additional_services": diff_table(
+                conn, services_table, services, service_key, service_block,
+                SERVICE_KEY_COLUMNS, SERVICE_VALUE_COLUMNS, prune
+            )
+        }
+        if not dry_run:
+            apply_changeset(conn, meals_table, changes["meals"], MEAL_KEY_COLUMNS, MEAL_VALUE_COLUMNS)
+            apply_changeset(conn, services_table, changes["additional_services"], SERVICE_KEY_COLUMNS, SERVICE_VALUE_COLUMNS)
+    if not dry_run:
+        # Publishes a new catalogue version; workers sharing the cache tier
+        # reload on their next request
+        price_table.invalidate()
+    return changes
+
+
+def replace_catalogue(meals: List[dict], services: List[dict]):
+    # Swap the whole catalogue in one transaction with batched multi-row inserts.
+    # Deleting meals also drops their meal_services links (ON DELETE CASCADE)
+    with engine.begin() as conn:
+        conn.execute(delete(models.AdditionalService.__table__))
+        conn.execute(delete(models.Meals.__table__))
+        if meals:
+            conn.execute(models.Meals.__table__.insert(), meals)
+        if services:
+            conn.execute(models.AdditionalService.__table__.insert(), services)
+    price_table.invalidate()
+
+
+def _refresh_note() -> str:
+    # The loader's invalidate() only reaches the API workers through a shared cache tier
+    if quote_cache.shared is None:
+        return "restart the API workers to pick up the change (no shared cache tier)"
+    return f"running workers reload within {quote_cache.version_check_seconds:g}s"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load pricing workbooks into meals/additional_services")
+    parser.add_argument("workbooks", nargs="+", help="Paths to .xlsx price sheets")
+    parser.add_argument("--dry-run", action="store_true", help="Parse, validate and report changes without writing")
+    parser.add_argument("--replace", action="store_true", help="Delete and reinsert the whole catalogue instead of applying a diff")
+    parser.add_argument(
+        "--prune", action="store_true",
+        help="Delete rows that are missing from the workbooks, within the food/plan/meal types they contain"
+    )
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    meals, services, errors = read_workbooks(args.workbooks)
+    print(f"Parsed {len(meals)} meals and {len(services)} additional services in {time.perf_counter() - start:.2f}s")
+
+    if errors:
+        for error in errors:
+            print(f"ERROR: {error}")
+        raise SystemExit(f"{len(errors)} invalid rows, nothing was written")
+
+    if args.replace:
+        if not args.dry_run:
+            replace_catalogue(meals, services)
+            print(f"Replaced catalogue in {time.perf_counter() - start:.2f}s; {_refresh_note()}")
+        return
+
+    changes = upsert_catalogue(meals, services, prune=args.prune, dry_run=args.dry_run)
+    for table, changeset in changes.items():
+        print(f"{table}: {changeset.summary()}")
+        for row in changeset.inserts:
+            print(f"  + {row}")
+        for row in changeset.updates:
+            print(f"  ~ {row}")
+        for row_id in changeset.deletes:
+            print(f"  - id={row_id}")
+    if not args.dry_run:
+        print(f"Applied changes in {time.perf_counter() - start:.2f}s; {_refresh_note()}")
+
+
+if __name__ == "__main__":
+    main()
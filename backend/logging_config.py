@@ -0,0 +1,98 @@
+import json
+import logging
+import os
+import random
+import time
+from typing import Callable, Dict
+
+# All logging is configured here, once, by configure_logging().
+#
+#   LOG_LEVEL=INFO                         root level
+#   LOG_FORMAT=text|json                   json writes one object per line, with any extra= fields
+#   LOG_ROUTE_LEVELS=calculate_total=DEBUG,save_details=WARNING
+#   LOG_SAMPLE_RATE=1.0                    fraction of per-request records kept (warnings and up always are)
+#   LOG_ROUTE_SAMPLE_RATES=calculate_total=0.01
+#
+# Per-request diagnostics (extra queries, full dumps) are only built when
+# diagnostics_enabled() says the route's logger is at DEBUG and the request
+# was sampled, so they cost nothing when switched off.
+
+ROUTE_LOGGER = "routes"
+
+
+def _parse_map(value: str, convert: Callable) -> Dict[str, object]:
+    settings = {}
+    for item in value.split(","):
+        name, sep, setting = item.partition("=")
+        if sep and name.strip():
+            settings[name.strip()] = convert(setting.strip())
+    return settings
+
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()
+ROUTE_LEVELS = _parse_map(os.getenv("LOG_ROUTE_LEVELS", ""), str.upper)
+SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "1"))
+ROUTE_SAMPLE_RATES = _parse_map(os.getenv("LOG_ROUTE_SAMPLE_RATES", ""), float)
+
+# Attributes every LogRecord has; anything else on a record came from extra=
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+_sample_rates: Dict[str, float] = {}
+_configured = False
+
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage()
+        }
+        for name, value in vars(record).items():
+            if name not in _RECORD_ATTRIBUTES:
+                entry[name] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure_logging():
+    global _configured
+    if _configured:
+        return
+    _configured = True
+
+    handler = logging.StreamHandler()
+    if LOG_FORMAT == "json":
+        handler.setFormatter(JSONFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s"))
+
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(LOG_LEVEL)
+
+
+def route_logger(route: str) -> logging.Logger:
+    # One logger per route under "routes.", so levels and sampling can be set per route
+    logger = logging.getLogger(f"{ROUTE_LOGGER}.{route}")
+    if route in ROUTE_LEVELS:
+        logger.setLevel(ROUTE_LEVELS[route])
+    _sample_rates[logger.name] = ROUTE_SAMPLE_RATES.get(route, SAMPLE_RATE)
+    return logger
+
+
+def sampled(logger: logging.Logger, level: int = logging.INFO) -> bool:
+    # Whether this request should log at `level`; warnings and errors are never sampled out
+    if not logger.isEnabledFor(level):
+        return False
+    if level >= logging.WARNING:
+        return True
+    rate = _sample_rates.get(logger.name, SAMPLE_RATE)
+    return rate >= 1 or random.random() < rate
+
+
+def diagnostics_enabled(logger: logging.Logger) -> bool:
+    return sampled(logger, logging.DEBUG)
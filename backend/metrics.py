@@ -0,0 +1,238 @@
+import time
+from bisect import bisect_left
+from threading import Lock
+from typing import Dict, Iterable, List, Tuple
+from starlette.datastructures import MutableHeaders
+from database import engine, async_engine, pool_stats, start_query_count
+from middleware import ASSERT_QUERY_COUNTS, query_budget_response
+from pricing import quote_cache
+from writebehind import user_details_queue
+
+# Prometheus text-format metrics, kept in process. Each worker exposes its own
+# numbers on /metrics, so scrape every worker (or run one per container).
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: Iterable[str], values: Iterable[str]) -> str:
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return f"{{{pairs}}}" if pairs else ""
+
+
+def _number(value) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        self.name, self.help, self.labels = name, help, labels
+        self._values: Dict[tuple, float] = {}
+        self._lock = Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for label_values, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labels, label_values)} {_number(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets=LATENCY_BUCKETS, labels: Tuple[str, ...] = ()):
+        self.name, self.help, self.labels = name, help, labels
+        self.buckets = tuple(buckets)
+        # label values -> (per-bucket counts incl. +Inf, sum)
+        self._series: Dict[tuple, list] = {}
+        self._lock = Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        names = self.labels + ("le",)
+        with self._lock:
+            for label_values, (counts, total) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + ("+Inf",), counts):
+                    cumulative += count
+                    lines.append(f"{self.name}_bucket{_labels(names, label_values + (bound,))} {cumulative}")
+                lines.append(f"{self.name}_sum{_labels(self.labels, label_values)} {_number(total)}")
+                lines.append(f"{self.name}_count{_labels(self.labels, label_values)} {cumulative}")
+        return lines
+
+
+ROUTE_LABELS = ("method", "route")
+
+requests_total = Counter(
+    "http_requests_total", "Requests handled, by route and status code", ROUTE_LABELS + ("status",)
+)
+request_seconds = Histogram(
+    "http_request_duration_seconds", "Time from request received to response returned", labels=ROUTE_LABELS
+)
+db_statements = Histogram(
+    "db_statements_per_request", "SQL statements executed per request", STATEMENT_BUCKETS, ROUTE_LABELS
+)
+db_seconds = Histogram(
+    "db_query_seconds_per_request", "Time spent executing SQL per request", labels=ROUTE_LABELS
+)
+db_pool_wait_seconds = Histogram(
+    "db_pool_wait_seconds_per_request", "Time spent waiting for a pooled connection per request", labels=ROUTE_LABELS
+)
+
+REGISTRY = [requests_total, request_seconds, db_statements, db_seconds, db_pool_wait_seconds]
+
+
+def _route_template(scope) -> str:
+    # The matched path template (/meals/{id}), not the raw URL, to keep label cardinality fixed
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+class MetricsMiddleware:
+    """Records request metrics, and enforces @query_budget when asserting counts.
+
+    Plain ASGI rather than an http middleware, so it adds no extra task or
+    response stream to the request; the status is read off the response start
+    message as it goes out.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = start_query_count()
+        start = time.perf_counter()
+        status = 500
+        replaced = False
+
+        async def send_wrapper(message):
+            nonlocal status, replaced
+            if message["type"] == "http.response.start":
+                if ASSERT_QUERY_COUNTS:
+                    # The handler has finished by the time its response starts
+                    replacement = query_budget_response(scope, stats)
+                    if replacement is not None:
+                        replaced = True
+                        status = replacement.status_code
+                        await replacement(scope, receive, send)
+                        return
+                    MutableHeaders(scope=message).append("X-DB-Queries", str(stats.statements))
+                status = message["status"]
+            elif replaced:
+                return
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            labels = (scope["method"], _route_template(scope))
+            requests_total.inc(*labels, str(status))
+            request_seconds.observe(elapsed, *labels)
+            db_statements.observe(stats.statements, *labels)
+            db_seconds.observe(stats.seconds, *labels)
+            db_pool_wait_seconds.observe(stats.pool_wait_seconds, *labels)
+
+
+def _pool_lines() -> List[str]:
+    # Pool gauges are read at scrape time rather than tracked per request
+    pools = {"sync": pool_stats(engine.pool), "async": pool_stats(async_engine.sync_engine.pool)}
+    metrics = (
+        ("db_pool_size", "gauge", "size", "Configured pool size"),
+        ("db_pool_checked_out", "gauge", "checked_out", "Connections currently checked out"),
+        ("db_pool_overflow", "gauge", "overflow", "Connections open beyond the pool size"),
+        ("db_pool_acquires_total", "counter", "acquire_count", "Connections handed out by the pool"),
+        ("db_pool_acquire_seconds_total", "counter", "acquire_seconds_total", "Total time spent acquiring connections")
+    )
+    lines = []
+    for name, kind, key, help in metrics:
+        values = [(engine_name, stats[key]) for engine_name, stats in pools.items() if stats.get(key) is not None]
+        if not values:
+            continue
+        lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+        lines += [f'{name}{{engine="{engine_name}"}} {_number(value)}' for engine_name, value in values]
+    return lines
+
+
+def _quote_cache_lines() -> List[str]:
+    stats = quote_cache.stats()
+    return [
+        "# HELP quote_cache_hits_total Quotes answered from the quote cache",
+        "# TYPE quote_cache_hits_total counter",
+        f"quote_cache_hits_total {stats['hits']}",
+        "# HELP quote_cache_misses_total Quotes that had to be computed",
+        "# TYPE quote_cache_misses_total counter",
+        f"quote_cache_misses_total {stats['misses']}",
+        "# HELP quote_cache_evictions_total Entries dropped to stay within QUOTE_CACHE_SIZE",
+        "# TYPE quote_cache_evictions_total counter",
+        f"quote_cache_evictions_total {stats['evictions']}",
+        "# HELP quote_cache_entries Quotes currently cached",
+        "# TYPE quote_cache_entries gauge",
+        f"quote_cache_entries {stats['entries']}",
+        "# HELP quote_cache_shared_hits_total Local misses answered by the shared tier",
+        "# TYPE quote_cache_shared_hits_total counter",
+        f'quote_cache_shared_hits_total{{backend="{stats["backend"]}"}} {stats["shared_hits"]}',
+        "# HELP quote_cache_shared_errors_total Failed calls to the shared tier",
+        "# TYPE quote_cache_shared_errors_total counter",
+        f'quote_cache_shared_errors_total{{backend="{stats["backend"]}"}} {stats["shared_errors"]}',
+        "# HELP quote_cache_dropped_writes_total Entries not written to the shared tier because its queue was full",
+        "# TYPE quote_cache_dropped_writes_total counter",
+        f'quote_cache_dropped_writes_total{{backend="{stats["backend"]}"}} {stats["dropped_writes"]}',
+        "# HELP pricing_catalogue_version Catalogue version this worker is on",
+        "# TYPE pricing_catalogue_version gauge",
+        f"pricing_catalogue_version {stats['version']}"
+    ]
+
+
+def _user_details_lines() -> List[str]:
+    stats = user_details_queue.stats()
+    return [
+        "# HELP user_details_buffered Submissions waiting to be written",
+        "# TYPE user_details_buffered gauge",
+        f"user_details_buffered {stats['buffered']}",
+        "# HELP user_details_written_total Submissions written to user_details",
+        "# TYPE user_details_written_total counter",
+        f"user_details_written_total {stats['flushed']}",
+        "# HELP user_details_flushes_total Batches written to user_details",
+        "# TYPE user_details_flushes_total counter",
+        f"user_details_flushes_total {stats['flushes']}",
+        "# HELP user_details_flush_errors_total Batch writes that failed and will be retried",
+        "# TYPE user_details_flush_errors_total counter",
+        f"user_details_flush_errors_total {stats['flush_errors']}",
+        "# HELP user_details_replayed_total Submissions recovered from spill files at startup",
+        "# TYPE user_details_replayed_total counter",
+        f"user_details_replayed_total {stats['replayed']}",
+        "# HELP user_details_rejected_total Submissions the database refused, set aside in the dead-letter file",
+        "# TYPE user_details_rejected_total counter",
+        f"user_details_rejected_total {stats['rejected']}"
+    ]
+
+
+def render_metrics() -> str:
+    lines = []
+    for metric in REGISTRY:
+        lines += metric.render()
+    lines += _pool_lines()
+    lines += _quote_cache_lines()
+    lines += _user_details_lines()
+    return "\n".join(lines) + "\n"
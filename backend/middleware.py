@@ -0,0 +1,33 @@
+import logging
+import os
+from typing import Optional
+from fastapi.responses import JSONResponse
+
+logger = logging.getLogger(__name__)
+
+# With DB_ASSERT_QUERY_COUNTS=1 every response carries X-DB-Queries and a route
+# that runs more statements than its @query_budget fails with a 500, so N+1
+# regressions show up in tests and benchmarks instead of production. The check
+# runs inside MetricsMiddleware (metrics.py), which already counts statements
+ASSERT_QUERY_COUNTS = os.getenv("DB_ASSERT_QUERY_COUNTS", "").lower() in ("1", "true", "yes")
+
+def query_budget(max_queries: int):
+    # Declares how many SQL statements a handler may run, independent of data size
+    def decorator(endpoint):
+        endpoint.query_budget = max_queries
+        return endpoint
+    return decorator
+
+def query_budget_response(scope, stats) -> Optional[JSONResponse]:
+    # The 500 to send instead of the handler's response when the matched route
+    # ran more statements than its @query_budget; None when within budget
+    route = scope.get("route")
+    budget = getattr(getattr(route, "endpoint", None), "query_budget", None)
+    if budget is None or stats.statements <= budget:
+        return None
+    logger.error(f"{scope['method']} {scope['path']} ran {stats.statements} queries, budget is {budget}")
+    return JSONResponse(
+        status_code=500,
+        content={"detail": f"Query budget exceeded: {stats.statements} > {budget}"},
+        headers={"X-DB-Queries": str(stats.statements)}
+    )
@@ -1,5 +1,62 @@
 from sqlalchemy import text
 from database import engine
+import models
+
+def _generated_key_columns():
+    # (table, column) of every *_key column the models declare as computed
+    for table in (models.Meals.__table__, models.AdditionalService.__table__):
+        for column in table.columns:
+            if column.computed is not None:
+                yield table, column
+
+def add_lookup_keys(conn):
+    # Normalized key columns, generated by the database (see NORMALIZE_SQL in
+    # models.py), plus the unique natural-key indexes the lookups use. Safe to
+    # run repeatedly; plain key columns from earlier versions are replaced
+    generated = set(conn.execute(text("""
+        SELECT table_name, column_name FROM information_schema.columns
+        WHERE table_schema = current_schema() AND is_generated = 'ALWAYS'
+    """)).all())
+    for table, column in _generated_key_columns():
+        if (table.name, column.name) in generated:
+            continue
+        # Dropping the old column also drops the indexes on it; they are recreated below
+        conn.execute(text(f"ALTER TABLE {table.name} DROP COLUMN IF EXISTS {column.name}"))
+        conn.execute(text(
+            f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(dialect=conn.dialect)} "
+            f"GENERATED ALWAYS AS ({column.computed.sqltext}) STORED"
+        ))
+
+    # Unique natural keys; these back the loader's INSERT ... ON CONFLICT and
+    # replace the earlier non-unique lookup indexes on the same leading columns.
+    # Fails if duplicate rows exist, which have to be cleaned up first
+    conn.execute(text("""
+        CREATE UNIQUE INDEX IF NOT EXISTS uq_meals_natural_key
+            ON meals (food_type_key, plan_type_key, num_people, basic_details_key);
+        CREATE UNIQUE INDEX IF NOT EXISTS uq_additional_services_natural_key
+            ON additional_services (code, food_type_key, plan_type_key, meal_combo);
+        DROP INDEX IF EXISTS ix_meals_lookup;
+        DROP INDEX IF EXISTS ix_additional_services_lookup;
+    """))
+
+def add_user_details(conn):
+    # Plan selections written by the save_details write-behind queue
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS user_details (
+            id SERIAL PRIMARY KEY,
+            submission_id VARCHAR(32) NOT NULL UNIQUE,
+            submitted_at TIMESTAMP WITH TIME ZONE NOT NULL,
+            food_type VARCHAR(20) NOT NULL,
+            plan_type VARCHAR(20) NOT NULL,
+            num_people INTEGER NOT NULL,
+            basic_details TEXT,
+            frequency TEXT,
+            duration TEXT,
+            kitchen_platform BOOLEAN,
+            base_price NUMERIC
+        );
+        CREATE INDEX IF NOT EXISTS ix_user_details_submitted_at ON user_details (submitted_at);
+    """))
 
 def migrate_database():
     with engine.connect() as conn:
@@ -55,5 +112,10 @@ def migrate_database():
         else:
             print("Tables already exist, skipping creation")
 
+        add_lookup_keys(conn)
+        add_user_details(conn)
+        conn.commit()
+        print("Lookup keys, indexes and user_details are up to date")
+
 if __name__ == "__main__":
     migrate_database() 
\ No newline at end of file
@@ -1,7 +1,25 @@
-from sqlalchemy import Column, Integer, String, Text, Numeric, Boolean, ForeignKey, Table
+import re
+from sqlalchemy import Column, Computed, Integer, String, Text, Numeric, Boolean, DateTime, ForeignKey, Table, Index
 from sqlalchemy.orm import relationship
 from database import Base
 
+def normalize_key(value) -> str:
+    # Canonical lookup form: case-insensitive, whitespace collapsed and
+    # "Non - Veg" / "Non-Veg" treated as the same value.
+    # Keep in sync with NORMALIZE_SQL below
+    if value is None:
+        return ""
+    value = " ".join(str(value).split())
+    return re.sub(r"\s*-\s*", "-", value).lower()
+
+# SQL equivalent of normalize_key(). The database computes the *_key columns
+# with it, so rows written with raw SQL or psql get correct keys too. SQLite
+# has no REGEXP_REPLACE/BTRIM; database.py registers Python versions there
+NORMALIZE_SQL = r"LOWER(REGEXP_REPLACE(BTRIM(REGEXP_REPLACE({column}, '\s+', ' ', 'g')), '\s*-\s*', '-', 'g'))"
+
+def _normalized(column):
+    return Computed(NORMALIZE_SQL.format(column=f"COALESCE({column}, '')"), persisted=True)
+
 # Association table for many-to-many relationship between meals and additional services
 meal_services = Table(
     "meal_services",
@@ -20,6 +38,16 @@ class Meals(Base):
     basic_price = Column(Numeric)
     basic_details = Column(Text)
 
+    # Normalized copies of the lookup columns, see normalize_key()
+    food_type_key = Column(String(20), _normalized("food_type"))
+    plan_type_key = Column(String(20), _normalized("plan_type"))
+    basic_details_key = Column(Text, _normalized("basic_details"))
+
+    __table_args__ = (
+        # Natural key of a meal row; also serves the quote lookups
+        Index("uq_meals_natural_key", "food_type_key", "plan_type_key", "num_people", "basic_details_key", unique=True),
+    )
+
     # Relationship to additional services
     additional_services = relationship(
         "AdditionalService",
@@ -45,6 +73,16 @@ class AdditionalService(Base):
     price_6 = Column(Numeric)
     price_7 = Column(Numeric)
 
+    # Normalized copies of the lookup columns, see normalize_key()
+    food_type_key = Column(String(20), _normalized("food_type"))
+    plan_type_key = Column(String(20), _normalized("plan_type"))
+
+    __table_args__ = (
+        # Natural key of an add-on row; its (code, food_type_key, plan_type_key)
+        # prefix serves the quote lookups
+        Index("uq_additional_services_natural_key", "code", "food_type_key", "plan_type_key", "meal_combo", unique=True),
+    )
+
     # Relationship to meals
     meals = relationship(
         "Meals",
@@ -52,3 +90,21 @@ class AdditionalService(Base):
         back_populates="additional_services"
     )
 
+class UserDetails(Base):
+    # Plan selections submitted through save_details, written in batches by
+    # user_details_queue (writebehind.py) rather than per request
+    __tablename__ = "user_details"
+
+    id = Column(Integer, primary_key=True, index=True)
+    # Assigned when the submission is queued, so a batch replayed from the
+    # spill file after a crash can't be inserted twice
+    submission_id = Column(String(32), nullable=False, unique=True)
+    submitted_at = Column(DateTime(timezone=True), nullable=False, index=True)
+    food_type = Column(String(20), nullable=False)
+    plan_type = Column(String(20), nullable=False)
+    num_people = Column(Integer, nullable=False)
+    basic_details = Column(Text)
+    frequency = Column(Text)
+    duration = Column(Text)
+    kitchen_platform = Column(Boolean)
+    base_price = Column(Numeric)
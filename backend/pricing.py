@@ -0,0 +1,378 @@
+import asyncio
+import hashlib
+import os
+from decimal import Decimal
+from enum import Enum
+from operator import attrgetter
+from threading import Lock
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from models import Meals, AdditionalService, normalize_key
+from serialization import dumps
+from cache import make_cache
+
+
+# Prices are held as tuples indexed by household size - 1. The sheets' last
+# column is "7+", so the price for 7 (or the largest size above it) also
+# prices every larger household.
+PriceVector = Tuple[Optional[Decimal], ...]
+OPEN_ENDED_SIZE = 7
+
+PRICE_COLUMNS = tuple(f"price_{n}" for n in range(1, 8))
+_price_columns = attrgetter(*PRICE_COLUMNS)
+_code = attrgetter("code")
+_HUNDRED = Decimal(100)
+
+
+class Stacking(str, Enum):
+    # What a percentage add-on is a percentage of
+    BASE = "base"          # the base price, so add-ons are independent of each other
+    COMPOUND = "compound"  # the running total, so earlier add-ons count towards later ones
+
+
+# PRICING_PERCENT_STACKING=base|compound, the same for every endpoint
+PERCENT_STACKING = Stacking(os.getenv("PRICING_PERCENT_STACKING", Stacking.BASE.value).lower())
+
+
+def price_vector(service) -> PriceVector:
+    # price_1..price_7 of an AdditionalService row (or any object with those attributes)
+    return tuple(None if price is None else Decimal(str(price)) for price in _price_columns(service))
+
+
+def priced_size(prices: PriceVector, num_people: int) -> Optional[int]:
+    # Household size whose price applies: num_people itself, or the last
+    # ("7+") size above the end of the vector
+    if num_people < 1:
+        return None
+    if num_people > len(prices):
+        return len(prices) if len(prices) >= OPEN_ENDED_SIZE else None
+    return num_people
+
+
+def price_at(prices: PriceVector, num_people: int) -> Optional[Decimal]:
+    size = priced_size(prices, num_people)
+    return None if size is None else prices[size - 1]
+
+
+class ServiceRate(NamedTuple):
+    code: str
+    name: str
+    is_percentage: bool
+    prices: PriceVector
+    # Meal type the row prices the add-on for; the sheets have one row per combination
+    meal_combo: str = ""
+
+    @classmethod
+    def from_row(cls, service) -> "ServiceRate":
+        return cls(
+            code=(service.code or "").strip(),
+            name=service.name,
+            is_percentage=bool(service.is_percentage),
+            prices=price_vector(service),
+            meal_combo=service.meal_combo or ""
+        )
+
+    def price_for(self, num_people: int) -> Optional[Decimal]:
+        return price_at(self.prices, num_people)
+
+    def amount(self, basis: Decimal, num_people: int) -> Optional[Decimal]:
+        # What this add-on adds to a quote; percentages are taken of `basis`,
+        # which apply_add_ons() picks according to the stacking policy
+        price = self.price_for(num_people)
+        if price is None:
+            return None
+        return basis * price / _HUNDRED if self.is_percentage else price
+
+
+class Quote(NamedTuple):
+    base_price: Decimal
+    total_price: Decimal
+    services: List[ServiceRate]
+    # Step-by-step breakdown, only built for explain requests
+    breakdown: Optional[dict] = None
+
+
+def quote_key(food_type: str, plan_type: str, num_people: int, meal_type: str, codes: Iterable[str]) -> tuple:
+    return (
+        normalize_key(food_type),
+        normalize_key(plan_type),
+        num_people,
+        normalize_key(meal_type),
+        tuple(sorted({code.strip() for code in codes}))
+    )
+
+
+# Finished quotes, keyed by catalogue version + normalized request.
+# QUOTE_CACHE_SIZE=0 turns it off; see cache.py for the shared tier settings
+quote_cache = make_cache()
+
+
+def apply_add_ons(base_price: Decimal, services: List[ServiceRate], num_people: int,
+                  stacking: Stacking = PERCENT_STACKING, steps: Optional[list] = None) -> Decimal:
+    """Total price of a base price plus add-ons, in one pass.
+
+    The pricing kernel every quote goes through. Add-ons are applied in code
+    order, which only matters for compound stacking; ones without a price for
+    this household size are not offered for it and are skipped. When a steps
+    list is given, each add-on's part of the calculation is recorded there.
+    """
+    if len(services) > 1:
+        services = sorted(services, key=_code)
+    compound = stacking is Stacking.COMPOUND
+    total = base_price
+    for service in services:
+        amount = service.amount(total if compound else base_price, num_people)
+        if steps is not None:
+            size = priced_size(service.prices, num_people)
+            steps.append({
+                "code": service.code,
+                "name": service.name,
+                "meal_combo": service.meal_combo,
+                "kind": "percentage" if service.is_percentage else "fixed",
+                "price_column": None if size is None else PRICE_COLUMNS[size - 1],
+                "rate": service.price_for(num_people),
+                "applied_to": (("running_total" if compound else "base_price") if service.is_percentage else None),
+                "amount": amount,
+                "running_total": total if amount is None else total + amount
+            })
+        if amount is not None:
+            total += amount
+    return total
+
+
+def price_quote(base_price: Decimal, services: List[ServiceRate], num_people: int,
+                explain: bool = False, base_price_size: Optional[int] = None) -> Quote:
+    if not explain:
+        return Quote(base_price, apply_add_ons(base_price, services, num_people), services)
+    steps = []
+    total = apply_add_ons(base_price, services, num_people, steps=steps)
+    return Quote(base_price, total, services, {
+        "num_people": num_people,
+        "stacking": PERCENT_STACKING.value,
+        "base_price": base_price,
+        "base_price_size": base_price_size or num_people,
+        "add_ons": steps,
+        "total_price": total
+    })
+
+
+class PriceTable:
+    """In-process copy of the meals/additional_services price sheet.
+
+    Loaded once from the database and then used to answer quotes without any
+    SQL round trips. Call reload() (or invalidate()) after the tables change.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        # Separate lock for async callers: holding the threading lock across an
+        # await would block the event loop for every other coroutine
+        self._async_lock = asyncio.Lock()
+        # Guards swapping the maps in and building the matrix from them; never
+        # held across I/O, so matrix() is safe to call on the event loop
+        self._swap_lock = Lock()
+        # (food_type, plan_type, basic_details) -> basic_price by household size
+        self._meals: Dict[Tuple[str, str, str], PriceVector] = {}
+        # (food_type, plan_type) -> code -> first ServiceRate by id, used when
+        # no row matches the meal type; (food_type, plan_type, meal_combo) ->
+        # code -> ServiceRate; and (food_type, plan_type) -> every row, for the matrix
+        self._services: Dict[Tuple[str, str], Dict[str, ServiceRate]] = {}
+        self._services_by_combo: Dict[Tuple[str, str, str], Dict[str, ServiceRate]] = {}
+        self._service_rows: Dict[Tuple[str, str], List[ServiceRate]] = {}
+        # food_type -> base price vectors of every plan/meal combination, and
+        # food_type -> code -> first ServiceRate across plans, for save_details
+        self._meals_by_food: Dict[str, List[PriceVector]] = {}
+        self._services_by_food: Dict[str, Dict[str, ServiceRate]] = {}
+        # (food_type, plan_type) -> display names and meal rows, for the price matrix
+        self._plans: Dict[Tuple[str, str], dict] = {}
+        # Serialized price matrix and its ETag, built on first request after a load
+        self._matrix: Optional[Tuple[bytes, str]] = None
+        # Catalogue version (see cache.py) the maps were loaded at
+        self._version = -1
+        self.loaded = False
+
+    def load(self, db: Session):
+        # Read the version before the rows, so a write that lands mid-load
+        # still leaves this table marked stale
+        version = quote_cache.version()
+        meals = {}
+        plans = {}
+        rows = db.query(
+            Meals.food_type,
+            Meals.plan_type,
+            Meals.num_people,
+            Meals.basic_details,
+            Meals.basic_price
+        ).order_by(Meals.id)
+        for food_type, plan_type, num_people, basic_details, basic_price in rows:
+            if num_people < 1:
+                continue
+            key = (normalize_key(food_type), normalize_key(plan_type), normalize_key(basic_details))
+            prices = meals.setdefault(key, [])
+            if len(prices) < num_people:
+                prices.extend([None] * (num_people - len(prices)))
+            if prices[num_people - 1] is not None:
+                continue
+            prices[num_people - 1] = Decimal(str(basic_price))
+            plan = plans.setdefault(key[:2], {"food_type": food_type, "plan_type": plan_type, "meals": []})
+            plan["meals"].append((num_people, basic_details, prices[num_people - 1]))
+        meals = {key: tuple(prices) for key, prices in meals.items()}
+        meals_by_food = {}
+        for key, prices in meals.items():
+            meals_by_food.setdefault(key[0], []).append(prices)
+
+        services = {}
+        services_by_combo = {}
+        service_rows = {}
+        services_by_food = {}
+        for service in db.query(AdditionalService).order_by(AdditionalService.id):
+            plan_key = (normalize_key(service.food_type), normalize_key(service.plan_type))
+            plans.setdefault(plan_key, {"food_type": service.food_type, "plan_type": service.plan_type, "meals": []})
+            rate = ServiceRate.from_row(service)
+            service_rows.setdefault(plan_key, []).append(rate)
+            services_by_combo.setdefault(plan_key + (normalize_key(rate.meal_combo),), {}).setdefault(rate.code, rate)
+            # First row wins, matching the old DISTINCT ON (code) behaviour
+            services.setdefault(plan_key, {}).setdefault(rate.code, rate)
+            services_by_food.setdefault(plan_key[0], {}).setdefault(rate.code, rate)
+
+        # Swap the new maps in as a whole so readers never see a partial table
+        with self._swap_lock:
+            self._meals, self._services, self._plans = meals, services, plans
+            self._services_by_combo, self._service_rows = services_by_combo, service_rows
+            self._meals_by_food, self._services_by_food = meals_by_food, services_by_food
+            self._matrix = None
+            self._version = version
+            self.loaded = True
+
+    @property
+    def current(self) -> bool:
+        # False after a local invalidate() or a catalogue change published by another worker
+        return self.loaded and self._version == quote_cache.version()
+
+    def ensure_loaded(self, db: Session):
+        if not self.current:
+            with self._lock:
+                if not self.current:
+                    self.load(db)
+
+    def reload(self, db: Session):
+        quote_cache.publish()
+        with self._lock:
+            self.load(db)
+
+    async def ensure_loaded_async(self, db: AsyncSession):
+        if not self.current:
+            async with self._async_lock:
+                if not self.current:
+                    await db.run_sync(self.load)
+
+    def invalidate(self):
+        # Call after writing meals/additional_services; every worker sharing
+        # the cache tier reloads on its next request
+        self.loaded = False
+        quote_cache.publish()
+
+    def base_prices(self, food_type: str, plan_type: str, meal_type: str) -> PriceVector:
+        return self._meals.get((normalize_key(food_type), normalize_key(plan_type), normalize_key(meal_type)), ())
+
+    def base_price(self, food_type: str, plan_type: str, num_people: int, meal_type: str) -> Optional[Decimal]:
+        return price_at(self.base_prices(food_type, plan_type, meal_type), num_people)
+
+    def plan_prices(self, food_type: str, num_people: int) -> List[Decimal]:
+        # Base price of every plan/meal combination offered for this food type and household size
+        prices = (price_at(vector, num_people) for vector in self._meals_by_food.get(normalize_key(food_type), ()))
+        return [price for price in prices if price is not None]
+
+    def food_service(self, food_type: str, code: str) -> Optional[ServiceRate]:
+        # An add-on by code for any plan of this food type (first row by id)
+        return self._services_by_food.get(normalize_key(food_type), {}).get(code)
+
+    def services(self, food_type: str, plan_type: str, codes: Iterable[str], meal_type: Optional[str] = None) -> List[ServiceRate]:
+        # Requested codes that exist for this food/plan type, de-duplicated, in
+        # request order; the row for meal_type when there is one, else the first
+        plan_key = (normalize_key(food_type), normalize_key(plan_type))
+        by_code = self._services.get(plan_key, {})
+        by_combo = self._services_by_combo.get(plan_key + (normalize_key(meal_type),), {}) if meal_type else {}
+        found = {}
+        for code in codes:
+            code = code.strip()
+            rate = by_combo.get(code) or by_code.get(code)
+            if rate is not None:
+                found.setdefault(rate.code, rate)
+        return list(found.values())
+
+    def quote(self, food_type: str, plan_type: str, num_people: int, meal_type: str,
+              codes: Iterable[str] = (), explain: bool = False) -> Optional[Quote]:
+        codes = list(codes)
+        # Keyed by the version this table was loaded at, so a quote from a stale table is never shared as current
+        key = ("quote", self._version, PERCENT_STACKING.value) + quote_key(food_type, plan_type, num_people, meal_type, codes)
+        if not explain:
+            cached = quote_cache.get(key)
+            if cached is not None:
+                return cached
+
+        base_prices = self.base_prices(food_type, plan_type, meal_type)
+        base_price = price_at(base_prices, num_people)
+        if base_price is None:
+            return None
+
+        applied = self.services(food_type, plan_type, codes, meal_type)
+        quote = price_quote(base_price, applied, num_people, explain, priced_size(base_prices, num_people))
+        if explain:
+            # Explained quotes are computed fresh and not cached
+            quote.breakdown["unmatched_services"] = sorted(
+                {code.strip() for code in codes} - {service.code for service in applied}
+            )
+        else:
+            # Cheaper to recompute from this table than to fetch from a shared tier
+            quote_cache.put(key, quote, shared=False)
+        return quote
+
+    def quote_sizes(self, food_type: str, plan_type: str, meal_type: str, codes: Iterable[str] = ()) -> PriceVector:
+        # Totals for every household size in one pass over the base price
+        # vector; None where the plan has no price for that size
+        applied = self.services(food_type, plan_type, codes, meal_type)
+        return tuple(
+            None if base_price is None else apply_add_ons(base_price, applied, num_people)
+            for num_people, base_price in enumerate(self.base_prices(food_type, plan_type, meal_type), start=1)
+        )
+
+    def matrix(self) -> Tuple[bytes, str]:
+        # Whole price grid as JSON bytes plus a strong ETag; rebuilt only after a (re)load
+        with self._swap_lock:
+            if self._matrix is None:
+                plans = []
+                for plan_key, plan in self._plans.items():
+                    plans.append({
+                        "food_type": plan["food_type"],
+                        "plan_type": plan["plan_type"],
+                        "meals": [
+                            {"num_people": num_people, "basic_details": basic_details, "basic_price": basic_price}
+                            for num_people, basic_details, basic_price in plan["meals"]
+                        ],
+                        "services": [
+                            {
+                                "code": rate.code,
+                                "name": rate.name,
+                                "meal_combo": rate.meal_combo,
+                                "is_percentage": rate.is_percentage,
+                                "prices": dict(enumerate(rate.prices, start=1))
+                            }
+                            for rate in self._service_rows.get(plan_key, ())
+                        ]
+                    })
+                body = dumps({"plans": plans})
+                self._matrix = (body, f'"{hashlib.sha256(body).hexdigest()}"')
+            return self._matrix
+
+    def stats(self) -> dict:
+        return {
+            "loaded": self.loaded,
+            "version": self._version,
+            "meals": sum(price is not None for prices in self._meals.values() for price in prices),
+            "services": sum(len(rows) for rows in self._service_rows.values())
+        }
+
+
+price_table = PriceTable()
@@ -0,0 +1,21 @@
+from sqlalchemy import Integer, any_, bindparam, select
+from sqlalchemy.dialects.postgresql import ARRAY
+import models
+from database import engine
+
+# Statements for the per-request lookups, built once at import. Their SQL never
+# depends on the arguments, so SQLAlchemy compiles each one once and asyncpg
+# keeps it in its prepared statement cache across requests.
+
+meal_by_id = select(models.Meals).where(models.Meals.id == bindparam("meal_id"))
+
+if engine.dialect.name == "postgresql":
+    # One array parameter, so the SQL is the same however many ids are passed
+    services_by_ids = select(models.AdditionalService).where(
+        models.AdditionalService.id == any_(bindparam("service_ids", type_=ARRAY(Integer)))
+    )
+else:
+    # No arrays in SQLite; an expanding IN is re-rendered per list length
+    services_by_ids = select(models.AdditionalService).where(
+        models.AdditionalService.id.in_(bindparam("service_ids", expanding=True))
+    )
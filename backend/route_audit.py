@@ -0,0 +1,74 @@
+import logging
+import os
+import re
+from typing import List
+
+logger = logging.getLogger(__name__)
+
+# Startup check of the routing table. Starlette dispatches to the first route
+# whose path and method match, so a second registration of the same path, or
+# a path an earlier pattern already captures (/meals/{id} before /meals/bulk),
+# is silently unreachable. Paths that differ only by a trailing slash are
+# reported too, since which one a client hits depends on how it spells the URL.
+#
+#   ROUTE_AUDIT=strict   refuse to start when a route is unreachable (default)
+#   ROUTE_AUDIT=warn     log the findings and start anyway
+#   ROUTE_AUDIT=off
+
+ROUTE_AUDIT = os.getenv("ROUTE_AUDIT", "strict").lower()
+
+_PARAM = re.compile(r"{[^}]*}")
+
+
+def _sample_path(path: str) -> str:
+    # A concrete URL the template matches; "1" satisfies both str and int params
+    return _PARAM.sub("1", path)
+
+
+def _flatten(routes):
+    # Newer FastAPI keeps an included router as one entry wrapping the
+    # original; the app includes routers without a prefix, so paths carry over
+    for route in routes:
+        included = getattr(route, "original_router", None)
+        if included is not None:
+            yield from _flatten(included.routes)
+        else:
+            yield route
+
+
+def _describe(route) -> str:
+    methods = ",".join(sorted(route.methods - {"HEAD"})) if route.methods else "*"
+    endpoint = getattr(route.endpoint, "__qualname__", repr(route.endpoint))
+    return f"{methods} {route.path} ({getattr(route.endpoint, '__module__', '?')}.{endpoint})"
+
+
+def audit_routes(routes) -> List[str]:
+    """Problems with a routing table, in registration order."""
+    routes = [route for route in _flatten(routes) if getattr(route, "methods", None) and hasattr(route, "path_regex")]
+    problems = []
+    for index, route in enumerate(routes):
+        sample = _sample_path(route.path)
+        earlier = [other for other in routes[:index] if (route.methods & other.methods) - {"HEAD"}]
+        # Most severe first: an exact duplicate, then a pattern that captures it
+        checks = (
+            ("duplicates", lambda other: other.path == route.path),
+            ("is shadowed by", lambda other: other.path_regex.match(sample)),
+            ("differs only by a trailing slash from", lambda other: other.path.rstrip("/") == route.path.rstrip("/"))
+        )
+        for problem, conflicts in checks:
+            other = next((other for other in earlier if conflicts(other)), None)
+            if other is not None:
+                problems.append(f"{_describe(route)} {problem} {_describe(other)}")
+                break
+    return problems
+
+
+def check_routes(app):
+    if ROUTE_AUDIT == "off":
+        return
+    problems = audit_routes(app.routes)
+    for problem in problems:
+        logger.error("Route audit: %s", problem)
+    if problems and ROUTE_AUDIT == "strict":
+        raise RuntimeError(f"{len(problems)} conflicting route(s), see the log; set ROUTE_AUDIT=warn to start anyway")
+    logger.info("Route audit: %d routes, %d problem(s)", len(list(_flatten(app.routes))), len(problems))
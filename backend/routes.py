@@ -1,21 +1,38 @@
-from fastapi import APIRouter, Depends, HTTPException, Body, Query
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Body, Query, Header, Response
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
 import models
+import queries
 import schemas
-from database import get_db
-from sqlalchemy import text
+from database import get_db, get_async_db, get_pool_stats
+from pricing import price_table, price_quote, apply_add_ons, quote_cache, ServiceRate, PRICE_COLUMNS, PERCENT_STACKING
+from middleware import query_budget
+from writebehind import user_details_queue
+from metrics import render_metrics
+from serialization import FastJSONResponse, MEAL_FIELDS, SERVICE_FIELDS, serialize_meal, serialize_service
+from sqlalchemy import select, insert
+from sqlalchemy.exc import IntegrityError
 from enum import Enum
-import json
-import logging
 from decimal import Decimal
+import logging
+from logging_config import route_logger, sampled, diagnostics_enabled
 
-# Set up logging
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
+quote_logger = route_logger("calculate_total")
+save_details_logger = route_logger("save_details")
 
 router = APIRouter()
 
+# Upper bound on the number of configurations priced by one batch request
+MAX_BATCH_QUOTES = 500
+# Upper bound on the number of meals created by one bulk request
+MAX_BULK_MEALS = 1000
+# Listing page sizes
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+# ?explain=true on the quote endpoints
+EXPLAIN_DESCRIPTION = "Include a step-by-step breakdown of the price (computed fresh, not from the quote cache)"
+
 class FoodType(str, Enum):
     VEG = "Veg"
     NON_VEG = "Non - Veg"
@@ -25,58 +42,161 @@ class PlanType(str, Enum):
     STANDARD = "Standard"
     PREMIUM = "Premium"
 
+PLAN_TYPES = tuple(pt.value for pt in PlanType)
+
+# Meal types save_details accepts; anything else falls back to the default
+VALID_MEAL_TYPES = frozenset((
+    "3 Meals {Breakfast+Tea & Lunch + Dinner}",
+    "2 Meals {Breakfast+Tea & Lunch}",
+    "1 Meal Lunch",
+    "1 Meal Dinner"
+))
+DEFAULT_MEAL_TYPE = "2 Meals {Breakfast+Tea & Lunch}"
+
+def _projected_columns(table, fields: str, allowed):
+    # Columns named in ?fields=..., always including id since it is the page cursor
+    names = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = [name for name in names if name not in allowed]
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown fields: {', '.join(unknown)}. Must be among: {', '.join(allowed)}"
+        )
+    if "id" not in names:
+        names.insert(0, "id")
+    return [table.c[name] for name in names]
+
+def _keyset_page(statement, id_column, filters, after_id, limit):
+    # Keyset pagination: rows after the cursor in id order, plus one extra row
+    # to tell whether another page exists
+    if after_id is not None:
+        filters = filters + [id_column > after_id]
+    return statement.where(*filters).order_by(id_column).limit(limit + 1)
+
+def _page_response(rows, limit, serialize):
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = rows[-1]["id"] if serialize is None else rows[-1].id
+
+    headers = {"X-Next-Cursor": str(next_cursor)} if next_cursor is not None else {}
+    # Rows are encoded directly rather than validated through the response model;
+    # projected (?fields=) rows are plain mappings already
+    content = [dict(row) for row in rows] if serialize is None else [serialize(row) for row in rows]
+    return FastJSONResponse(content=content, headers=headers)
+
+
+def _explain_value(value):
+    # Breakdown prices are reported as numbers, like the quote they explain
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, dict):
+        return {key: _explain_value(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_explain_value(item) for item in value]
+    return value
+
+
 @router.get("/meals/", response_model=List[schemas.Meal])
-def get_meals(
-    db: Session = Depends(get_db)
+@query_budget(2)
+async def get_meals(
+    food_type: Optional[str] = None,
+    plan_type: Optional[str] = None,
+    num_people: Optional[int] = None,
+    after_id: Optional[int] = Query(None, description="Return meals after this id; pass the previous page's X-Next-Cursor"),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    fields: Optional[str] = Query(None, description="Comma-separated columns to return, e.g. id,num_people,basic_price"),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    meals = db.query(models.Meals).all()
-    return meals
+    filters = []
+    if food_type is not None:
+        filters.append(models.Meals.food_type_key == models.normalize_key(food_type))
+    if plan_type is not None:
+        filters.append(models.Meals.plan_type_key == models.normalize_key(plan_type))
+    if num_people is not None:
+        filters.append(models.Meals.num_people == num_people)
+
+    if fields:
+        statement = select(*_projected_columns(models.Meals.__table__, fields, MEAL_FIELDS))
+    else:
+        # Async sessions can't lazy load, so fetch additional_services up front
+        statement = select(models.Meals).options(selectinload(models.Meals.additional_services))
+
+    result = await db.execute(_keyset_page(statement, models.Meals.id, filters, after_id, limit))
+    rows = result.mappings().all() if fields else result.scalars().all()
+    return _page_response(rows, limit, None if fields else serialize_meal)
 
 @router.get("/additional-services/", response_model=List[schemas.AdditionalService])
-def get_additional_services(
-    num_people: int,
-    db: Session = Depends(get_db)
+@query_budget(1)
+async def get_additional_services(
+    num_people: Optional[int] = Query(None, ge=1, description="Only services priced for this many people"),
+    food_type: Optional[str] = None,
+    plan_type: Optional[str] = None,
+    code: Optional[str] = None,
+    after_id: Optional[int] = Query(None, description="Return services after this id; pass the previous page's X-Next-Cursor"),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    fields: Optional[str] = Query(None, description="Comma-separated columns to return, e.g. code,price_3"),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    services = db.query(models.AdditionalService).all()
-    return services
+    filters = []
+    if num_people is not None:
+        # Households above 7 are priced from the "7+" column
+        price_column = PRICE_COLUMNS[min(num_people, len(PRICE_COLUMNS)) - 1]
+        filters.append(models.AdditionalService.__table__.c[price_column].isnot(None))
+    if food_type is not None:
+        filters.append(models.AdditionalService.food_type_key == models.normalize_key(food_type))
+    if plan_type is not None:
+        filters.append(models.AdditionalService.plan_type_key == models.normalize_key(plan_type))
+    if code is not None:
+        filters.append(models.AdditionalService.code == code)
+
+    if fields:
+        statement = select(*_projected_columns(models.AdditionalService.__table__, fields, SERVICE_FIELDS))
+    else:
+        statement = select(models.AdditionalService)
+
+    result = await db.execute(_keyset_page(statement, models.AdditionalService.id, filters, after_id, limit))
+    rows = result.mappings().all() if fields else result.scalars().all()
+    return _page_response(rows, limit, None if fields else serialize_service)
 
 @router.post("/calculate-price/")
-def calculate_price(
+async def calculate_price(
     request: schemas.PriceCalculationRequest,
-    db: Session = Depends(get_db)
+    explain: bool = Query(False, description=EXPLAIN_DESCRIPTION),
+    db: AsyncSession = Depends(get_async_db)
 ):
+    # Repeated meal/service combinations are answered from the quote cache
+    cache_key = ("price", quote_cache.version(), PERCENT_STACKING.value, request.meal_id, tuple(sorted(set(request.service_ids))))
+    cached = None if explain else await quote_cache.get_async(cache_key)
+    if cached is not None:
+        return cached
+
     # Get meal
-    meal = db.query(models.Meals).filter(
-        models.Meals.id == request.meal_id
-    ).first()
+    result = await db.execute(queries.meal_by_id, {"meal_id": request.meal_id})
+    meal = result.scalars().first()
     
     if not meal:
         raise HTTPException(status_code=404, detail="Meal not found")
     
     # Get additional services
-    services = db.query(models.AdditionalService).filter(
-        models.AdditionalService.id.in_(request.service_ids)
-    ).all()
+    services = []
+    if request.service_ids:
+        result = await db.execute(queries.services_by_ids, {"service_ids": list(set(request.service_ids))})
+        services = result.scalars().all()
     
-    # Calculate total price
-    total_price = meal.basic_price
-    for service in services:
-        # Get the appropriate price based on number of people
-        price_field = getattr(service, f'price_{meal.num_people}')
-        if service.is_percentage:
-            total_price += (meal.basic_price * price_field / 100)
-        else:
-            total_price += price_field
+    # One pass through the pricing kernel; services_price is the add-ons' share of it
+    quote = price_quote(meal.basic_price, [ServiceRate.from_row(service) for service in services], meal.num_people, explain)
     
-    return {
+    response = {
         "meal_price": meal.basic_price,
-        "services_price": sum(
-            getattr(service, f'price_{meal.num_people}') if not service.is_percentage 
-            else (meal.basic_price * getattr(service, f'price_{meal.num_people}') / 100)
-            for service in services
-        ),
-        "total_price": total_price
+        "services_price": quote.total_price - quote.base_price,
+        "total_price": quote.total_price
     }
+    if explain:
+        response["explain"] = _explain_value(quote.breakdown)
+    else:
+        quote_cache.put(cache_key, response)
+    return response
 
 @router.post("/meals/", response_model=schemas.Meal)
 def create_meal(
@@ -109,210 +229,327 @@ def create_meal(
         db.add(db_meal)
         db.commit()
         db.refresh(db_meal)
+        price_table.invalidate()
         return db_meal
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/meals/bulk", response_model=List[schemas.Meal])
+def create_meals_bulk(
+    meals: List[schemas.MealCreate],
+    db: Session = Depends(get_db)
+):
+    if len(meals) > MAX_BULK_MEALS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {MAX_BULK_MEALS} meals can be created at once"
+        )
+    if not meals:
+        return []
+
+    try:
+        # Resolve every referenced service in one query
+        service_ids = {service_id for meal in meals for service_id in meal.service_ids or []}
+        services = {}
+        if service_ids:
+            services = {
+                service.id: service
+                for service in db.query(models.AdditionalService).filter(
+                    models.AdditionalService.id.in_(service_ids)
+                )
+            }
+            missing = sorted(service_ids - services.keys())
+            if missing:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Invalid service IDs: {', '.join(map(str, missing))}"
+                )
+
+        # Serialize the services now; the commit below would expire them
+        service_schemas = {
+            service_id: schemas.AdditionalService.model_validate(service)
+            for service_id, service in services.items()
+        }
+
+        # All meals in one multi-row INSERT; RETURNING the natural key (which the
+        # database generates) maps the new ids back to the request rows
+        # regardless of row order
+        rows = [
+            {
+                "food_type": meal.food_type,
+                "plan_type": meal.plan_type,
+                "num_people": meal.num_people,
+                "basic_price": meal.basic_price,
+                "basic_details": meal.basic_details
+            }
+            for meal in meals
+        ]
+        natural_key = (
+            models.Meals.food_type_key,
+            models.Meals.plan_type_key,
+            models.Meals.num_people,
+            models.Meals.basic_details_key
+        )
+        result = db.execute(
+            insert(models.Meals).values(rows).returning(models.Meals.id, *natural_key)
+        )
+        meal_ids = {tuple(key): meal_id for meal_id, *key in result}
+
+        created = []
+        links = []
+        for meal in meals:
+            meal_id = meal_ids[(
+                models.normalize_key(meal.food_type),
+                models.normalize_key(meal.plan_type),
+                meal.num_people,
+                models.normalize_key(meal.basic_details)
+            )]
+            meal_service_ids = list(dict.fromkeys(meal.service_ids or []))
+            links.extend({"meal_id": meal_id, "service_id": service_id} for service_id in meal_service_ids)
+            created.append(schemas.Meal(
+                id=meal_id,
+                **meal.model_dump(exclude={"service_ids"}),
+                additional_services=[service_schemas[service_id] for service_id in meal_service_ids]
+            ))
+
+        # All association rows in one batched statement, then a single commit
+        if links:
+            db.execute(models.meal_services.insert(), links)
+        db.commit()
+        price_table.invalidate()
+        return created
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(
+            status_code=409,
+            detail="One or more meals already exist for the same food type, plan type, number of people and meal"
+        )
+    except HTTPException:
+        db.rollback()
+        raise
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/pricing/reload")
+def reload_pricing(
+    db: Session = Depends(get_db)
+):
+    # Re-read meals/additional_services into the in-process price table
+    price_table.reload(db)
+    return {"status": "success", "data": price_table.stats()}
+
+@router.get("/health/pool")
+def pool_health():
+    # Connection pool usage for monitoring
+    return get_pool_stats()
+
+@router.get("/metrics")
+def get_metrics():
+    # Prometheus scrape endpoint
+    return Response(content=render_metrics(), media_type="text/plain; version=0.0.4")
+
+@router.get("/price-matrix")
+async def get_price_matrix(
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_async_db)
+):
+    await price_table.ensure_loaded_async(db)
+    body, etag = price_table.matrix()
+
+    # Clients holding the current matrix get an empty 304. If-None-Match uses
+    # weak comparison, since proxies that compress the body mark the tag W/
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if if_none_match:
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        if "*" in tags or etag in tags:
+            return Response(status_code=304, headers=headers)
+
+    return Response(content=body, media_type="application/json", headers=headers)
+
+def _quote_response(quote, food_type, plan_type, num_people, meal_type, services):
+    response = {
+        "base_price": float(quote.base_price),
+        "total_price": float(quote.total_price),
+        "num_people": num_people,
+        "food_type": food_type,
+        "plan_type": plan_type,
+        "meal_type": meal_type,
+        "services": services
+    }
+    if quote.breakdown is not None:
+        response["explain"] = _explain_value(quote.breakdown)
+    return response
+
 @router.get("/calculate_total")
-def calculate_total(
+async def calculate_total(
     food_type: str,
     plan_type: str,
     num_people: int,
     meal_type: str,
     services: List[str] = Query([]),
-    db: Session = Depends(get_db)
+    explain: bool = Query(False, description=EXPLAIN_DESCRIPTION),
+    db: AsyncSession = Depends(get_async_db)
 ):
     try:
-        logger.info("=== Request Details ===")
-        logger.info(f"Query Parameters: food_type={food_type}, plan_type={plan_type}, num_people={num_people}, meal_type={meal_type}")
-        
         # Convert food type to match database format
         db_food_type = food_type.replace(" - ", "-").strip()
-        logger.info(f"Converted food_type to: {db_food_type}")
-        
-        # Get base price
-        base_query = text("""
-            SELECT basic_price FROM meals 
-            WHERE LOWER(TRIM(food_type))=LOWER(TRIM(:food_type)) 
-            AND LOWER(TRIM(plan_type))=LOWER(TRIM(:plan_type)) 
-            AND num_people=:num_people 
-            AND LOWER(TRIM(basic_details))=LOWER(TRIM(:meal_type))
-        """)
-        
-        logger.info("Executing base price query with parameters:")
-        logger.info(f"food_type={db_food_type}, plan_type={plan_type}, num_people={num_people}, meal_type={meal_type}")
         
-        base_result = db.execute(base_query, {
-            "food_type": db_food_type,
-            "plan_type": plan_type,
-            "num_people": num_people,
-            "meal_type": meal_type
-        }).fetchone()
-        
-        if not base_result:
-            logger.error("No matching meal plan found")
+        # Prices come from the in-process price table; the DB is only hit on first load
+        await price_table.ensure_loaded_async(db)
+
+        quote = price_table.quote(db_food_type, plan_type, num_people, meal_type, services, explain)
+
+        if quote is None:
+            if sampled(quote_logger, logging.DEBUG):
+                quote_logger.debug(
+                    "No meal plan found for %s/%s/%s/%s", db_food_type, plan_type, num_people, meal_type,
+                    extra={"food_type": db_food_type, "plan_type": plan_type, "num_people": num_people, "meal_type": meal_type}
+                )
             raise HTTPException(
                 status_code=404,
                 detail=f"No meal plan found for food_type={db_food_type}, plan_type={plan_type}, num_people={num_people}, meal_type={meal_type}"
             )
+
+        response = _quote_response(quote, db_food_type, plan_type, num_people, meal_type, services)
+
+        if sampled(quote_logger, logging.DEBUG):
+            quote_logger.debug(
+                "Quoted %s/%s/%s: %s", db_food_type, plan_type, num_people, quote.total_price,
+                extra={"food_type": db_food_type, "plan_type": plan_type, "num_people": num_people,
+                       "services": services, "total_price": str(quote.total_price)}
+            )
         
-        base_price = base_result[0]
-        total = Decimal(str(base_price))
-        
-        # Get additional services if any
-        if services:
-            # Convert services to a set to ensure uniqueness
-            unique_services = set(services)
-            
-            placeholders = ', '.join([':service' + str(i) for i in range(len(unique_services))])
-            add_query = text(f"""
-                SELECT code, name, is_percentage, price_{num_people} as price 
-                FROM additional_services 
-                WHERE LOWER(TRIM(food_type))=LOWER(TRIM(:food_type)) 
-                AND LOWER(TRIM(plan_type))=LOWER(TRIM(:plan_type))
-                AND code IN ({placeholders})
-            """)
-            
-            params = {
-                "food_type": db_food_type,
-                "plan_type": plan_type
-            }
-            params.update({f"service{i}": service for i, service in enumerate(unique_services)})
-            
-            logger.info("Executing additional services query with parameters:")
-            logger.info(f"Query: {add_query}")
-            logger.info(f"Parameters: {params}")
-            
-            results = db.execute(add_query, params).fetchall()
-            
-            logger.info("Additional services found:")
-            # Track processed services to prevent duplicates
-            processed_services = set()
-            
-            for code, name, is_percent, price in results:
-                # Skip if we've already processed this service
-                if code in processed_services:
-                    logger.info(f"Skipping duplicate service: {code}")
-                    continue
-                    
-                processed_services.add(code)
-                logger.info(f"Service: {code} ({name})")
-                logger.info(f"Is Percentage: {is_percent}")
-                logger.info(f"Price: {price}")
-                
-                if is_percent:
-                    service_amount = (base_price * Decimal(str(price)) / Decimal('100'))
-                    logger.info(f"Percentage calculation: {base_price} * {price}% = {service_amount}")
-                    total += service_amount
-                else:
-                    logger.info(f"Adding fixed amount: {price}")
-                    total += Decimal(str(price))
-                
-                logger.info(f"Running total: {total}")
-        
-        response = {
-            "base_price": float(base_price),
-            "total_price": float(total),
-            "num_people": num_people,
-            "food_type": db_food_type,
-            "plan_type": plan_type,
-            "meal_type": meal_type,
-            "services": services
-        }
-        
-        logger.info("=== Response ===")
-        logger.info(json.dumps(response, indent=2))
-        
-        return response
+        return FastJSONResponse(response)
         
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Error in calculate_total: {str(e)}")
+        quote_logger.error("Error in calculate_total: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/calculate_total/batch")
+async def calculate_total_batch(
+    request: schemas.BatchQuoteRequest,
+    explain: bool = Query(False, description=EXPLAIN_DESCRIPTION),
+    db: AsyncSession = Depends(get_async_db)
+):
+    if len(request.quotes) > MAX_BATCH_QUOTES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {MAX_BATCH_QUOTES} quotes can be requested at once"
+        )
+
+    # One table load at most, then every quote is priced in-process
+    await price_table.ensure_loaded_async(db)
+
+    quotes = []
+    for item in request.quotes:
+        db_food_type = item.food_type.replace(" - ", "-").strip()
+        quote = price_table.quote(db_food_type, item.plan_type, item.num_people, item.meal_type, item.services, explain)
+        if quote is None:
+            quotes.append({
+                "num_people": item.num_people,
+                "food_type": db_food_type,
+                "plan_type": item.plan_type,
+                "meal_type": item.meal_type,
+                "services": item.services,
+                "error": "No meal plan found"
+            })
+        else:
+            quotes.append(_quote_response(quote, db_food_type, item.plan_type, item.num_people, item.meal_type, item.services))
+
+    return FastJSONResponse({"quotes": quotes})
+
+@router.get("/calculate_total/sizes")
+async def calculate_total_sizes(
+    food_type: str,
+    plan_type: str,
+    meal_type: str,
+    services: List[str] = Query([]),
+    db: AsyncSession = Depends(get_async_db)
+):
+    # Totals for every household size of one plan, priced in a single pass
+    await price_table.ensure_loaded_async(db)
+
+    db_food_type = food_type.replace(" - ", "-").strip()
+    totals = price_table.quote_sizes(db_food_type, plan_type, meal_type, services)
+    if not any(total is not None for total in totals):
+        raise HTTPException(
+            status_code=404,
+            detail=f"No meal plan found for food_type={db_food_type}, plan_type={plan_type}, meal_type={meal_type}"
+        )
+
+    return FastJSONResponse({
+        "food_type": db_food_type,
+        "plan_type": plan_type,
+        "meal_type": meal_type,
+        "services": services,
+        "total_prices": {
+            str(num_people): float(total) for num_people, total in enumerate(totals, start=1) if total is not None
+        }
+    })
+
 @router.post("/save_details")
+@query_budget(2)
 def save_details(
     details: schemas.UserDetails,
     db: Session = Depends(get_db)
 ):
     try:
-        logger.info("=== Saving User Details ===")
-        logger.info(f"Received details: {details.dict()}")
-
-        # Debug: Check all meal plans in database
-        all_meals_query = text("""
-            SELECT * FROM meals 
-            ORDER BY food_type, plan_type, num_people
-        """)
-        all_meals = db.execute(all_meals_query).fetchall()
-        logger.info("=== All Meal Plans in Database ===")
-        for meal in all_meals:
-            logger.info(f"Meal: {meal}")
+        if diagnostics_enabled(save_details_logger):
+            save_details_logger.debug("Received details: %s", details.model_dump())
 
         # Convert food type to match database format
         db_food_type = FoodType.VEG.value if details.food_type.lower() in ["vegetarian", "veg"] else FoodType.NON_VEG.value
         
         # Convert plan type to match database format
         plan_type = details.plan_type.capitalize()
-        if plan_type not in [pt.value for pt in PlanType]:
-            logger.error(f"Invalid plan type: {plan_type}")
+        if plan_type not in PLAN_TYPES:
+            save_details_logger.info("Invalid plan type: %s", plan_type)
             raise HTTPException(
                 status_code=400,
-                detail=f"Invalid plan type. Must be one of: {', '.join([pt.value for pt in PlanType])}"
+                detail=f"Invalid plan type. Must be one of: {', '.join(PLAN_TYPES)}"
             )
 
         # Validate number of people
         if not 1 <= details.num_people <= 7:
-            logger.error(f"Invalid number of people: {details.num_people}")
+            save_details_logger.info("Invalid number of people: %s", details.num_people)
             raise HTTPException(
                 status_code=400,
                 detail="Number of people must be between 1 and 7"
             )
 
         # Validate meal type format
-        valid_meal_types = [
-            "3 Meals {Breakfast+Tea & Lunch + Dinner}",
-            "2 Meals {Breakfast+Tea & Lunch}",
-            "1 Meal Lunch",
-            "1 Meal Dinner"
-        ]
-        
-        if details.basic_details not in valid_meal_types:
-            logger.warning(f"Invalid meal type: {details.basic_details}, defaulting to 2 Meals")
-            details.basic_details = "2 Meals {Breakfast+Tea & Lunch}"
-
-        # Get base price
-        base_query = text("""
-            SELECT * FROM meals 
-            WHERE food_type=:food_type 
-            AND plan_type=:plan_type 
-            AND num_people=:num_people 
-            AND basic_details=:meal_type
-        """)
-        
-        params = {
-            "food_type": db_food_type,
-            "plan_type": plan_type,
-            "num_people": details.num_people,
-            "meal_type": details.basic_details
-        }
-        
-        logger.info("=== Query Parameters ===")
-        logger.info(f"food_type: {db_food_type}")
-        logger.info(f"plan_type: {plan_type}")
-        logger.info(f"num_people: {details.num_people}")
-        logger.info(f"meal_type: {details.basic_details}")
-        
-        base_result = db.execute(base_query, params).fetchone()
+        if details.basic_details not in VALID_MEAL_TYPES:
+            save_details_logger.warning("Invalid meal type: %s, defaulting to 2 Meals", details.basic_details)
+            details.basic_details = DEFAULT_MEAL_TYPE
+
+        # Validated and priced against the in-process catalogue; the DB is
+        # only read when the price table needs (re)loading
+        price_table.ensure_loaded(db)
+        base_price = price_table.base_price(db_food_type, plan_type, details.num_people, details.basic_details)
         
-        if not base_result:
-            logger.error("No matching meal plan found")
-            logger.error(f"Query parameters: {params}")
+        if base_price is None:
+            save_details_logger.debug("No matching meal plan found")
             raise HTTPException(
                 status_code=404,
                 detail=f"No meal plan found for food_type={db_food_type}, plan_type={plan_type}, num_people={details.num_people}, meal_type={details.basic_details}"
             )
 
+        # Persisted in batches by the write-behind queue
+        user_details_queue.submit({
+            "food_type": db_food_type,
+            "plan_type": plan_type,
+            "num_people": details.num_people,
+            "basic_details": details.basic_details,
+            "frequency": details.frequency,
+            "duration": details.duration,
+            "kitchen_platform": details.kitchen_platform,
+            "base_price": base_price
+        })
+
         # Return success response with the details
         response = {
             "status": "success",
@@ -321,93 +558,91 @@ def save_details(
                 "plan_type": plan_type,
                 "num_people": details.num_people,
                 "basic_details": details.basic_details,
-                "base_price": float(base_result.basic_price),
-                "available_plans": 24  # This could be calculated based on available plans
+                "base_price": float(base_price),
+                "available_plans": len(price_table.plan_prices(db_food_type, details.num_people))
             }
         }
 
-        logger.info("=== Response ===")
-        logger.info(json.dumps(response, indent=2))
+        if sampled(save_details_logger, logging.DEBUG):
+            save_details_logger.debug("Saved details", extra=response["data"])
 
         return response
 
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Error in save_details: {str(e)}")
+        save_details_logger.error("Error in save_details: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
-        # Convert food type to match database format
-        db_food_type = FoodType.VEG.value if details.food_type.lower() in ["vegetarian", "veg"] else FoodType.NON_VEG.value
-        
-        # Convert plan type to match database format
+@router.post("/api/save_details")
+@query_budget(2)
+def save_plan_details(details: schemas.PlanDetails, db: Session = Depends(get_db)):
+    try:
+        if details.num_people < 1 or details.num_people > 10:
+            raise HTTPException(status_code=400, detail="Number of people must be between 1 and 10")
+
+        # The row is written after the response, so anything user_details
+        # would refuse has to be caught here
         plan_type = details.plan_type.capitalize()
-        if plan_type not in [pt.value for pt in PlanType]:
-            logger.error(f"Invalid plan type: {plan_type}")
+        if plan_type not in PLAN_TYPES:
             raise HTTPException(
                 status_code=400,
-                detail=f"Invalid plan type. Must be one of: {', '.join([pt.value for pt in PlanType])}"
+                detail=f"Invalid plan type. Must be one of: {', '.join(PLAN_TYPES)}"
             )
-
-        # Validate number of people
-        if not 1 <= details.num_people <= 7:
-            logger.error(f"Invalid number of people: {details.num_people}")
+        
+        # Convert food type to match database format
+        food_type = details.food_type.replace(" - ", "-").strip()
+        db_food_type = next(
+            (ft.value for ft in FoodType if models.normalize_key(ft.value) == models.normalize_key(food_type)), None
+        )
+        
+        # Meal plans and the KP add-on come from the in-process catalogue
+        price_table.ensure_loaded(db)
+        meal_prices = price_table.plan_prices(food_type, details.num_people)
+        
+        if db_food_type is None or not meal_prices:
             raise HTTPException(
-                status_code=400,
-                detail="Number of people must be between 1 and 7"
+                status_code=404,
+                detail=f"No meal plans found for {food_type} with {details.num_people} people"
             )
-
-        # Validate meal type format
-        valid_meal_types = [
-            "3 Meals {Breakfast+Tea & Lunch + Dinner}",
-            "2 Meals {Breakfast+Tea & Lunch}",
-            "1 Meal Lunch",
-            "1 Meal Dinner"
-        ]
         
-        if details.basic_details not in valid_meal_types:
-            logger.warning(f"Invalid meal type: {details.basic_details}, defaulting to 2 Meals")
-            details.basic_details = "2 Meals {Breakfast+Tea & Lunch}"
-
-        # Get base price
-        base_query = text("""
-            SELECT basic_price FROM meals 
-            WHERE food_type=:food_type 
-            AND plan_type=:plan_type 
-            AND num_people=:num_people 
-            AND basic_details=:meal_type
-        """)
+        # Calculate base price considering kitchen platform
+        base_price = sum(meal_prices, Decimal('0'))
         
-        base_result = db.execute(base_query, {
+        # Add kitchen platform cleaning cost if selected
+        if details.kitchen_platform:
+            kitchen_service = price_table.food_service(food_type, 'KP')
+            if kitchen_service is not None:
+                base_price = apply_add_ons(base_price, [kitchen_service], details.num_people)
+
+        # Stored by the write-behind queue, not in this request
+        user_details_queue.submit({
             "food_type": db_food_type,
             "plan_type": plan_type,
             "num_people": details.num_people,
-            "meal_type": details.basic_details
-        }).fetchone()
-
-        if not base_result:
-            logger.error("No matching meal plan found")
-            raise HTTPException(
-                status_code=404,
-                detail=f"No meal plan found for the provided details"
-            )
-
-        # Return success response with the details
-        response = {
+            "basic_details": details.basic_details,
+            "frequency": details.frequency,
+            "duration": details.duration,
+            "kitchen_platform": details.kitchen_platform,
+            "base_price": base_price
+        })
+        
+        return {
             "status": "success",
             "data": {
-                "food_type": db_food_type,
-                "plan_type": plan_type,
+                "food_type": details.food_type,
+                "plan_type": details.plan_type,
                 "num_people": details.num_people,
                 "basic_details": details.basic_details,
-                "base_price": float(base_result[0]),
-                "available_plans": 24  # This could be calculated based on available plans
+                "frequency": details.frequency,
+                "duration": details.duration,
+                "kitchen_platform": details.kitchen_platform,
+                "base_price": float(base_price),
+                "available_plans": len(meal_prices)
             }
         }
-
-        logger.info("=== Response ===")
-        logger.info(json.dumps(response, indent=2))
-
-        return response
-
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Error in save_details: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e)) 
\ No newline at end of file
+        save_details_logger.error("Error in save_plan_details: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
@@ -49,6 +49,27 @@ class UserDetails(BaseModel):
     duration: Optional[str] = None
     kitchen_platform: Optional[bool] = False
 
+class PlanDetails(BaseModel):
+    # /api/save_details: every plan for the food type and size, plus the
+    # kitchen platform add-on
+    food_type: str
+    plan_type: str
+    num_people: int
+    basic_details: str
+    frequency: str = "8 Times/Month"
+    duration: str = "1.5 Hour"
+    kitchen_platform: bool
+
+class QuoteRequest(BaseModel):
+    food_type: str
+    plan_type: str
+    num_people: int
+    meal_type: str
+    services: List[str] = []
+
+class BatchQuoteRequest(BaseModel):
+    quotes: List[QuoteRequest]
+
 class PriceCalculationRequest(BaseModel):
     meal_id: int
     service_ids: List[int] 
\ No newline at end of file
@@ -0,0 +1,62 @@
+import json
+from decimal import Decimal
+from operator import attrgetter
+from typing import Callable, Iterable, List
+from fastapi.responses import Response
+import schemas
+
+try:
+    import orjson
+except ImportError:  # falls back to the stdlib encoder
+    orjson = None
+
+# Listing and quote responses skip response_model validation and are encoded
+# straight from ORM rows. Decimals are written as strings, the same as the
+# pydantic schemas do, so clients see identical payloads on either path.
+
+def _default(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+if orjson is not None:
+    def dumps(content) -> bytes:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+else:
+    def dumps(content) -> bytes:
+        return json.dumps(content, default=_default, separators=(",", ":"), ensure_ascii=False).encode()
+
+
+class FastJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+
+def row_serializer(fields: Iterable[str]) -> Callable[[object], dict]:
+    # Attribute getters are built once per field list, not per row
+    getters = [(name, attrgetter(name)) for name in fields]
+
+    def serialize(row) -> dict:
+        return {name: get(row) for name, get in getters}
+
+    return serialize
+
+
+# Same field order as schemas.Meal / schemas.AdditionalService
+SERVICE_FIELDS = list(schemas.AdditionalService.model_fields)
+MEAL_FIELDS = [name for name in schemas.Meal.model_fields if name != "additional_services"]
+
+serialize_service = row_serializer(SERVICE_FIELDS)
+_serialize_meal_columns = row_serializer(MEAL_FIELDS)
+
+
+def serialize_meal(meal) -> dict:
+    data = _serialize_meal_columns(meal)
+    data["additional_services"] = [serialize_service(service) for service in meal.additional_services]
+    return data
+
+
+def serialize_meals(meals) -> List[dict]:
+    return [serialize_meal(meal) for meal in meals]
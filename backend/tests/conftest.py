@@ -0,0 +1,55 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORKBOOKS = [os.path.join(BACKEND, "Veg_Breakfast_Lunch.xlsx"), os.path.join(BACKEND, "Pricing MD Yadh.xlsx")]
+
+# Settings are read when the app modules are imported, so they go in the
+# environment before any test module imports them
+_tmp = tempfile.mkdtemp(prefix="pricing-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp, 'test.db')}"
+os.environ["USER_DETAILS_SPILL_DIR"] = os.path.join(_tmp, "spill")
+os.environ["PRICING_CACHE_BACKEND"] = "local"
+os.environ["DB_ASSERT_QUERY_COUNTS"] = "1"
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+sys.path.insert(0, BACKEND)
+
+
+@pytest.fixture(scope="session")
+def catalogue():
+    # Both workbooks loaded into a fresh SQLite database, with every meal
+    # linked to its plan's add-ons so listings have relationships to load
+    from sqlalchemy import select
+    import loader
+    import models
+    from database import Base, engine
+
+    Base.metadata.create_all(engine)
+    meals, services, errors = loader.read_workbooks(WORKBOOKS)
+    assert not errors
+    loader.upsert_catalogue(meals, services)
+
+    meals_table = models.Meals.__table__
+    services_table = models.AdditionalService.__table__
+    with engine.begin() as conn:
+        links = conn.execute(
+            select(meals_table.c.id.label("meal_id"), services_table.c.id.label("service_id")).join(
+                services_table,
+                (services_table.c.food_type_key == meals_table.c.food_type_key)
+                & (services_table.c.plan_type_key == meals_table.c.plan_type_key)
+            )
+        ).mappings().all()
+        conn.execute(models.meal_services.insert(), [dict(link) for link in links])
+    return meals, services
+
+
+@pytest.fixture(scope="session")
+def client(catalogue):
+    from fastapi.testclient import TestClient
+    from main import app
+
+    with TestClient(app) as client:
+        yield client
@@ -0,0 +1,102 @@
+from decimal import Decimal
+
+import pytest
+from openpyxl import load_workbook
+
+import loader
+from conftest import WORKBOOKS
+from database import SessionLocal
+from middleware import ASSERT_QUERY_COUNTS
+from pricing import Stacking, apply_add_ons, price_table
+
+FINAL_PRICE_LABEL = "final price a + b + c"
+
+
+def _text(value) -> str:
+    return " ".join(value.split()).lower() if isinstance(value, str) else ""
+
+
+def sheet_totals(path):
+    # (food_type, plan_type, meal_type, num_people) -> the sheet's own
+    # "Final Price A + B + C" for every block that has one
+    totals = {}
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        for sheet in workbook.worksheets:
+            blocks = {}
+            for row in sheet.iter_rows(values_only=True):
+                for offset, label in enumerate(_text(value) for value in row):
+                    if offset + 1 >= len(row):
+                        break
+                    block = blocks.setdefault(offset, {})
+                    if label == "food type":
+                        block["food_type"] = row[offset + 1]
+                    elif label == "plan type":
+                        block["plan_type"] = row[offset + 1]
+                    elif label == "number of people":
+                        block["sizes"] = [int(str(value).rstrip("+")) for value in row[offset + 1:offset + 8]]
+                    elif label == "basic details":
+                        block["meal_type"] = " ".join(row[offset + 1].split())
+                    elif label == FINAL_PRICE_LABEL and "food_type" in block:
+                        for size, total in zip(block["sizes"], row[offset + 1:]):
+                            if not isinstance(total, (int, float)):
+                                # The sheet has a few #VALUE! cells
+                                continue
+                            key = (block["food_type"], block["plan_type"], block["meal_type"], size)
+                            totals[key] = Decimal(str(total))
+    finally:
+        workbook.close()
+    return totals
+
+
+@pytest.fixture(scope="module")
+def loaded_table(catalogue):
+    db = SessionLocal()
+    try:
+        price_table.ensure_loaded(db)
+    finally:
+        db.close()
+    return price_table
+
+
+def test_base_stacking_matches_sheet_final_price(loaded_table):
+    totals = sheet_totals(WORKBOOKS[1])
+    assert totals
+    for (food_type, plan_type, meal_type, num_people), expected in totals.items():
+        base_price = loaded_table.base_price(food_type, plan_type, num_people, meal_type)
+        services = loaded_table.services(food_type, plan_type, ["A", "B", "C"], meal_type)
+        assert [service.code for service in services] == ["A", "B", "C"]
+
+        assert apply_add_ons(base_price, services, num_people, Stacking.BASE) == expected
+
+        # Compound stacking takes C's percentage of base + A + B instead
+        fixed = sum(service.price_for(num_people) for service in services if not service.is_percentage)
+        percent = sum(service.price_for(num_people) for service in services if service.is_percentage)
+        compound = apply_add_ons(base_price, services, num_people, Stacking.COMPOUND)
+        assert compound == (base_price + fixed) * (1 + percent / 100)
+        assert compound != expected
+
+
+def test_loader_second_run_is_a_no_op(catalogue):
+    meals, services, errors = loader.read_workbooks(WORKBOOKS)
+    assert not errors
+    for table, changes in loader.upsert_catalogue(meals, services, prune=True).items():
+        assert changes == loader.Changeset([], [], []), f"{table}: {changes.summary()}"
+
+
+@pytest.mark.parametrize("path, params", [
+    ("/meals/", {}),
+    ("/meals/", {"food_type": "veg", "plan_type": "Basic", "num_people": 2}),
+    ("/meals/", {"limit": 5, "after_id": 5}),
+    ("/meals/", {"fields": "id,num_people,basic_price"}),
+    ("/additional-services/", {}),
+    ("/additional-services/", {"num_people": 9, "code": "A"}),
+    ("/additional-services/", {"fields": "code,price_3", "limit": 10}),
+])
+def test_listings_stay_within_query_budget(client, path, params):
+    assert ASSERT_QUERY_COUNTS
+    response = client.get(path, params=params)
+    # Over budget would be a 500 from MetricsMiddleware
+    assert response.status_code == 200, response.text
+    assert response.json()
+    assert int(response.headers["X-DB-Queries"]) >= 1
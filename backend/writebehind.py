@@ -0,0 +1,303 @@
+import fcntl
+import glob
+import json
+import logging
+import os
+import threading
+import uuid
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import List, Optional, Tuple
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import InterfaceError, OperationalError
+from database import engine
+import models
+
+logger = logging.getLogger(__name__)
+
+# Write-behind queue for save_details submissions. Requests only append the
+# row to an in-memory buffer and a spill file; a background thread inserts
+# the buffer in one multi-row INSERT once it holds USER_DETAILS_BATCH_SIZE
+# rows or every USER_DETAILS_FLUSH_SECONDS, whichever comes first.
+#
+#   USER_DETAILS_BATCH_SIZE=500
+#   USER_DETAILS_FLUSH_SECONDS=2
+#   USER_DETAILS_SPILL_DIR=./spill        one active spill file per worker
+#   USER_DETAILS_FSYNC=false              fsync every submission; without it a
+#                                         process crash loses nothing, but a
+#                                         host crash can lose the page cache
+#
+# Each worker owns its spill files through an exclusive flock. A file is
+# deleted once its rows are committed; files left behind by a crashed worker
+# are unlocked, and are replayed by the next worker that starts. Rows carry a
+# submission_id and are inserted with ON CONFLICT DO NOTHING, so a batch that
+# committed just before the crash isn't stored twice.
+#
+# A batch the database refuses for any reason other than a lost connection is
+# retried row by row; rows that still fail are appended to DEAD_LETTER_FILE in
+# the spill directory instead of blocking every later batch.
+
+SPILL_PATTERN = "user_details.*.jsonl"
+DEAD_LETTER_FILE = "rejected.user_details.jsonl"
+
+
+def _to_row(record: dict) -> dict:
+    # Spill file records hold JSON types; convert back to what the columns take
+    row = dict(record)
+    row["submitted_at"] = datetime.fromisoformat(row["submitted_at"])
+    if row.get("base_price") is not None:
+        row["base_price"] = Decimal(row["base_price"])
+    return row
+
+
+class SpillFile:
+    """Append-only JSONL file holding one batch of buffered submissions."""
+
+    def __init__(self, path: str, fsync: bool = False):
+        self.path = path
+        self.fsync = fsync
+        self._file = open(path, "a", encoding="utf-8")
+        try:
+            fcntl.flock(self._file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            self._file.close()
+            raise
+
+    @classmethod
+    def create(cls, path: str, fsync: bool = False) -> "SpillFile":
+        # Locked under a name _replay() doesn't match before it's renamed into
+        # place, so another worker can never pick up a fresh, unlocked file
+        spill = cls(path + ".tmp", fsync)
+        try:
+            os.rename(spill.path, path)
+        except OSError:
+            spill.discard()
+            raise
+        spill.path = path
+        return spill
+
+    def append(self, record: dict):
+        self._file.write(json.dumps(record, separators=(",", ":")) + "\n")
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+
+    def discard(self):
+        # Rows are committed; unlink before unlocking so no one replays it
+        os.unlink(self.path)
+        self._file.close()
+
+    def close(self):
+        self._file.close()
+
+
+class WriteBehindQueue:
+    def __init__(self, table, spill_dir: str, batch_size: int = 500,
+                 flush_seconds: float = 2.0, fsync: bool = False):
+        self.table = table
+        self.spill_dir = spill_dir
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        # Serializes flushes between the background thread, stop() and callers
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._buffer: List[dict] = []
+        self._spill: Optional[SpillFile] = None
+        # Batches taken from the buffer but not yet committed, oldest first
+        self._pending: List[Tuple[SpillFile, List[dict]]] = []
+        self.submitted = 0
+        self.flushed = 0
+        self.flushes = 0
+        self.flush_errors = 0
+        self.replayed = 0
+        self.rejected = 0
+
+    def _new_spill(self) -> SpillFile:
+        name = SPILL_PATTERN.replace("*", f"{os.getpid()}-{uuid.uuid4().hex[:8]}")
+        return SpillFile.create(os.path.join(self.spill_dir, name), self.fsync)
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            os.makedirs(self.spill_dir, exist_ok=True)
+            self._replay()
+            self._spill = self._new_spill()
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name="user-details-writer", daemon=True)
+            self._thread.start()
+        if self._pending:
+            self._wake.set()
+
+    def stop(self):
+        # Final flush; whatever can't be written stays in the spill files
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        self._stopping.set()
+        self._wake.set()
+        thread.join()
+        self.flush()
+        with self._lock:
+            for spill, _ in self._pending:
+                spill.close()
+            self._pending = []
+            if self._spill is not None:
+                if self._buffer:
+                    self._spill.close()
+                else:
+                    self._spill.discard()
+                self._spill = None
+
+    def submit(self, row: dict) -> str:
+        if self._thread is None:
+            self.start()
+        record = dict(row)
+        record["submission_id"] = uuid.uuid4().hex
+        record["submitted_at"] = datetime.now(timezone.utc).isoformat()
+        if record.get("base_price") is not None:
+            record["base_price"] = str(record["base_price"])
+        with self._lock:
+            # Durable before it's acknowledged
+            self._spill.append(record)
+            self._buffer.append(record)
+            self.submitted += 1
+            full = len(self._buffer) >= self.batch_size
+        if full:
+            self._wake.set()
+        return record["submission_id"]
+
+    def _run(self):
+        while not self._stopping.is_set():
+            self._wake.wait(self.flush_seconds)
+            self._wake.clear()
+            if self._stopping.is_set():
+                break
+            try:
+                self.flush()
+            except Exception:
+                # e.g. the spill directory is full; keep the writer alive and retry
+                logger.exception("Flushing user_details failed")
+
+    def flush(self) -> int:
+        with self._flush_lock:
+            written = self._write_pending()
+            with self._lock:
+                # The buffered rows move out with their spill file and new
+                # submissions go to a fresh one, but only once earlier batches
+                # are written, so an outage keeps a single spill file open.
+                # The new file is opened first; if that fails the rows stay put
+                rotate = bool(self._buffer) and not self._pending
+                if rotate:
+                    spill = self._new_spill() if self._thread is not None else None
+                    self._pending.append((self._spill, self._buffer))
+                    self._buffer = []
+                    self._spill = spill
+            if rotate:
+                written += self._write_pending()
+            self.flushed += written
+            return written
+
+    def _write_pending(self) -> int:
+        with self._lock:
+            pending = list(self._pending)
+        written = 0
+        for spill, records in pending:
+            try:
+                self._insert(records)
+                inserted = len(records)
+            except Exception as e:
+                self.flush_errors += 1
+                if isinstance(e, (OperationalError, InterfaceError)):
+                    # Database unreachable; keep the batch and its spill file
+                    # for the next flush
+                    logger.warning("Writing %d user_details rows failed: %s", len(records), e)
+                    break
+                logger.warning("Writing %d user_details rows failed, retrying them one by one: %s", len(records), e)
+                try:
+                    inserted = self._insert_each(records)
+                except (OperationalError, InterfaceError) as e:
+                    logger.warning("Writing %d user_details rows failed: %s", len(records), e)
+                    break
+            with self._lock:
+                self._pending.remove((spill, records))
+            spill.discard()
+            written += inserted
+            self.flushes += 1
+        return written
+
+    def _insert_each(self, records: List[dict]) -> int:
+        inserted = 0
+        for record in records:
+            try:
+                self._insert([record])
+                inserted += 1
+            except (OperationalError, InterfaceError):
+                raise
+            except Exception as e:
+                self._reject(record, e)
+        return inserted
+
+    def _reject(self, record: dict, error: Exception):
+        self.rejected += 1
+        logger.error("Rejected user_details submission %s: %s", record.get("submission_id"), error)
+        with open(os.path.join(self.spill_dir, DEAD_LETTER_FILE), "a", encoding="utf-8") as f:
+            # Shared by every worker; the lock keeps their lines whole
+            fcntl.flock(f, fcntl.LOCK_EX)
+            f.write(json.dumps(dict(record, error=str(error)), separators=(",", ":")) + "\n")
+
+    def _insert(self, records: List[dict]):
+        with engine.begin() as conn:
+            dialect = postgresql if conn.dialect.name == "postgresql" else sqlite
+            statement = dialect.insert(self.table).on_conflict_do_nothing(index_elements=["submission_id"])
+            for start in range(0, len(records), self.batch_size):
+                conn.execute(statement, [_to_row(r) for r in records[start:start + self.batch_size]])
+
+    def _replay(self):
+        # Spill files nobody holds a lock on belong to workers that died
+        # before flushing them
+        for path in sorted(glob.glob(os.path.join(self.spill_dir, SPILL_PATTERN))):
+            try:
+                spill = SpillFile(path, self.fsync)
+            except BlockingIOError:
+                continue
+            with open(path, encoding="utf-8") as f:
+                # A crash mid-write can leave a partial last line
+                records = []
+                for line in f:
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        logger.warning("Skipping unreadable line in %s", path)
+            if records:
+                self._pending.append((spill, records))
+                self.replayed += len(records)
+                logger.info("Replaying %d buffered user_details rows from %s", len(records), path)
+            else:
+                spill.discard()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "buffered": len(self._buffer) + sum(len(records) for _, records in self._pending),
+                "submitted": self.submitted,
+                "flushed": self.flushed,
+                "flushes": self.flushes,
+                "flush_errors": self.flush_errors,
+                "replayed": self.replayed,
+                "rejected": self.rejected
+            }
+
+
+user_details_queue = WriteBehindQueue(
+    models.UserDetails.__table__,
+    spill_dir=os.getenv("USER_DETAILS_SPILL_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "spill")),
+    batch_size=int(os.getenv("USER_DETAILS_BATCH_SIZE", "500")),
+    flush_seconds=float(os.getenv("USER_DETAILS_FLUSH_SECONDS", "2")),
+    fsync=os.getenv("USER_DETAILS_FSYNC", "false").lower() in ("1", "true", "yes")
+)